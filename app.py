@@ -1,28 +1,74 @@
 # office-space/app.py
 import sqlite3
 import os
-from flask import Flask, request, jsonify, render_template, g
+import re
+import io
+import csv
+import json
+import gzip
+import hashlib
+import threading
+import time
+import contextlib
+from datetime import date, datetime, timedelta, timezone
+import click
+from flask import Flask, Response, request, jsonify, render_template, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+import change_stream
+import db_pool
+import history
+import metrics
+import result_cache
+try:
+    import brotli # Optional: enables 'Content-Encoding: br' for /api/offices
+except ImportError:
+    brotli = None
 
 # --- Configuration ---
 DATABASE = 'mydatabase.db' # Name of the SQLite database file
 
 # --- Flask App Setup ---
 app = Flask(__name__, static_folder='.', static_url_path='') # Serve static files from root
+# Overrides for db_pool.DEFAULT_SETTINGS (journal_mode, synchronous, cache_size, mmap_size, busy_timeout, ...)
+app.config.setdefault('SQLITE_SETTINGS', {})
+# Statements taking at least this many seconds are logged with their SQL and parameters (None disables)
+app.config.setdefault('SLOW_QUERY_SECONDS', 0.1)
+# Per-process cache of floor and office responses (see result_cache.py): entries kept per kind, and their lifetime in seconds
+app.config.setdefault('RESULT_CACHE_ENTRIES', 512)
+app.config.setdefault('RESULT_CACHE_TTL', 300.0)
 
 # --- Database Helper Functions ---
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it from app.config on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = db_pool.ConnectionPool(DATABASE, app.config['SQLITE_SETTINGS'],
+                                               row_factory=sqlite3.Row) # Return rows that behave like dictionaries
+    return _pool
+
 def get_db():
-    """Opens a new database connection if there is none yet for the current application context."""
+    """Checks a warm connection out of the pool if there is none yet for the current application context."""
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row # Return rows that behave like dictionaries
+        g.db = get_pool().acquire()
+        g.db.query_observer = g.get('timings') # Per-request SQL timing for /metrics
+        ensure_support_schema(g.db)
     return g.db
 
 @app.teardown_appcontext
 def close_db(error):
-    """Closes the database again at the end of the request."""
+    """Returns the connection to the pool at the end of the request (rolling back anything left open)."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+def begin_write(db):
+    """Starts a write transaction, waiting out (and retrying) other writers instead of failing with 'database is locked'."""
+    get_pool().begin_immediate(db)
 
 def init_db_schema():
     """Defines the schema for the office assignments table."""
@@ -36,12 +82,371 @@ def init_db_schema():
         start_date TEXT, -- Store dates as ISO 8601 strings (YYYY-MM-DD)
         end_date TEXT,   -- Store dates as ISO 8601 strings (YYYY-MM-DD)
         is_temporary BOOLEAN DEFAULT FALSE,
+        version INTEGER NOT NULL DEFAULT 1, -- Bumped by every update; clients send it back in If-Match
 
         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
     );
     -- Optional: Index for faster lookups by office_id
     CREATE INDEX IF NOT EXISTS idx_office_id ON office_assignments (office_id);
+    """ + assignment_indexes_schema() + support_schema()
+
+def assignment_indexes_schema():
+    """Indexes on office_assignments added after the table was first defined. Safe to re-run."""
+    return """
+    -- Date-range planning queries (/api/offices?as_of=, /api/vacancies). Permanent occupants have
+    -- end_date NULL and sort first, so 'end_date >= ?' and 'end_date BETWEEN ? AND ?' are index range scans.
+    CREATE INDEX IF NOT EXISTS idx_assignments_end_start ON office_assignments (end_date, start_date);
+    -- No query filtered on start_date alone, so this only slowed down writes
+    DROP INDEX IF EXISTS idx_assignments_start;
+    """
+
+def support_schema():
+    """Non-destructive schema for the bookkeeping tables. Safe to run against an existing database."""
+    return """
+    -- Single-row counter bumped by every write (API routes and migrate_csv.py).
+    -- 'epoch' changes whenever the database is re-created so cached versions never collide.
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        epoch TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO data_version (id, epoch, version) VALUES (1, lower(hex(randomblob(8))), 0);
+
+    -- One row per data version: which occupant changed and how ('insert', 'update', 'delete').
+    -- Bulk writers that don't log individual rows record op = 'reset' (occupant_id NULL).
+    CREATE TABLE IF NOT EXISTS change_log (
+        version INTEGER PRIMARY KEY,
+        op TEXT NOT NULL,
+        occupant_id INTEGER,
+        office_id TEXT,
+        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Rooms drawn on the floor plan, per floor, in display order. Seeded from DEFAULT_FLOOR_ROOMS.
+    -- x/y/width/height place the room on its floor's drawing; NULL until place_rooms() puts it on the grid
+    -- (at startup, or when /api/layout next finds the room unplaced).
+    CREATE TABLE IF NOT EXISTS rooms (
+        office_id TEXT PRIMARY KEY,
+        floor INTEGER NOT NULL,
+        sort_order INTEGER NOT NULL DEFAULT 0,
+        x INTEGER,
+        y INTEGER,
+        width INTEGER,
+        height INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_rooms_floor ON rooms (floor, sort_order);
+
+    -- Bumped by every change to rooms, so /api/layout (and browsers caching it) can tell when the floor plan moved
+    CREATE TABLE IF NOT EXISTS layout_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO layout_version (id, version) VALUES (1, 0);
+    CREATE TRIGGER IF NOT EXISTS rooms_layout_insert AFTER INSERT ON rooms BEGIN
+        UPDATE layout_version SET version = version + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS rooms_layout_update AFTER UPDATE ON rooms BEGIN
+        UPDATE layout_version SET version = version + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS rooms_layout_delete AFTER DELETE ON rooms BEGIN
+        UPDATE layout_version SET version = version + 1 WHERE id = 1;
+    END;
+
+    -- Temporary occupants moved out of office_assignments after their end date ('flask expire-occupants')
+    CREATE TABLE IF NOT EXISTS office_assignments_archive (
+        id INTEGER PRIMARY KEY, -- The id they had in office_assignments
+        office_id TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        appointment_type TEXT,
+        start_date TEXT,
+        end_date TEXT,
+        is_temporary BOOLEAN,
+        timestamp DATETIME,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    -- The date-range queries read archived assignments too; past windows are range scans here as well
+    CREATE INDEX IF NOT EXISTS idx_archive_end_start ON office_assignments_archive (end_date, start_date);
+    """
+
+def search_schema():
+    """FTS5 index over occupant names and appointment types, kept in sync with office_assignments by triggers."""
+    return """
+    -- External-content table: the text lives in office_assignments, only the index is stored here.
+    -- remove_diacritics 2 makes 'Sandstrom' match 'Sandström'; prefix indexes make 2-3 letter prefix queries cheap.
+    CREATE VIRTUAL TABLE IF NOT EXISTS occupant_search USING fts5(
+        full_name, appointment_type,
+        content='office_assignments', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    CREATE TRIGGER IF NOT EXISTS occupant_search_insert AFTER INSERT ON office_assignments BEGIN
+        INSERT INTO occupant_search (rowid, full_name, appointment_type) VALUES (new.id, new.full_name, new.appointment_type);
+    END;
+    CREATE TRIGGER IF NOT EXISTS occupant_search_delete AFTER DELETE ON office_assignments BEGIN
+        INSERT INTO occupant_search (occupant_search, rowid, full_name, appointment_type) VALUES ('delete', old.id, old.full_name, old.appointment_type);
+    END;
+    CREATE TRIGGER IF NOT EXISTS occupant_search_update AFTER UPDATE OF full_name, appointment_type ON office_assignments BEGIN
+        INSERT INTO occupant_search (occupant_search, rowid, full_name, appointment_type) VALUES ('delete', old.id, old.full_name, old.appointment_type);
+        INSERT INTO occupant_search (rowid, full_name, appointment_type) VALUES (new.id, new.full_name, new.appointment_type);
+    END;
+    """
+
+def ensure_search_index(db):
+    """Creates the search index and its triggers if missing, indexing any existing occupants."""
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'occupant_search'").fetchone() is not None
+    db.executescript(search_schema())
+    if not exists:
+        # Name matches outrank appointment type matches
+        db.execute("INSERT INTO occupant_search (occupant_search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+        db.execute("INSERT INTO occupant_search (occupant_search) VALUES ('rebuild')")
+        db.commit()
+
+UNPLACED_FLOOR = -1 # Floor recorded in the stats tables for offices that aren't in the rooms table
+
+def stats_schema():
+    """Occupancy summary tables (see /api/stats), kept current by triggers on office_assignments.
+
+    office_stats counts occupants per office and appointment type; its own triggers roll those counts up
+    into floor_stats (per floor and type) and floor_summary (rooms and occupied rooms per floor), so
+    reading the summary costs one row per floor and type however many occupants there are. Triggers on
+    rooms keep the rollups current when rooms are added, removed or moved to another floor.
     """
+    floor_of = lambda row: f"COALESCE((SELECT floor FROM rooms WHERE office_id = {row}.office_id), {UNPLACED_FLOOR})"
+
+    def move_office(office_id, from_floor, to_floor):
+        """Statements moving an office's office_stats counts from one floor's rollups to another's."""
+        return f"""
+        UPDATE floor_stats SET
+            occupants = occupants - (SELECT s.occupants FROM office_stats s WHERE s.office_id = {office_id} AND s.appointment_type = floor_stats.appointment_type),
+            offices = offices - 1
+        WHERE floor = {from_floor} AND appointment_type IN (SELECT appointment_type FROM office_stats WHERE office_id = {office_id});
+        DELETE FROM floor_stats WHERE floor = {from_floor} AND offices <= 0;
+        INSERT INTO floor_stats (floor, appointment_type, occupants, offices)
+        SELECT {to_floor}, appointment_type, occupants, 1 FROM office_stats WHERE office_id = {office_id}
+        ON CONFLICT (floor, appointment_type) DO UPDATE SET occupants = occupants + excluded.occupants, offices = offices + 1;
+        UPDATE floor_summary SET occupied_rooms = occupied_rooms - 1
+        WHERE floor = {from_floor} AND EXISTS (SELECT 1 FROM office_stats WHERE office_id = {office_id});
+        INSERT INTO floor_summary (floor, occupied_rooms)
+        SELECT {to_floor}, 1 WHERE EXISTS (SELECT 1 FROM office_stats WHERE office_id = {office_id})
+        ON CONFLICT (floor) DO UPDATE SET occupied_rooms = occupied_rooms + 1;
+        DELETE FROM floor_summary WHERE floor = {from_floor} AND rooms = 0 AND occupied_rooms <= 0;"""
+    add_room = "INSERT INTO floor_summary (floor, rooms) VALUES (new.floor, 1) ON CONFLICT (floor) DO UPDATE SET rooms = rooms + 1;"
+    remove_room = "UPDATE floor_summary SET rooms = rooms - 1 WHERE floor = old.floor;"
+    return f"""
+    -- appointment_type '' stands for none
+    CREATE TABLE IF NOT EXISTS office_stats (
+        office_id TEXT NOT NULL,
+        appointment_type TEXT NOT NULL,
+        occupants INTEGER NOT NULL,
+        PRIMARY KEY (office_id, appointment_type)
+    ) WITHOUT ROWID;
+    -- 'offices' counts the offices on the floor with at least one occupant of the type
+    CREATE TABLE IF NOT EXISTS floor_stats (
+        floor INTEGER NOT NULL,
+        appointment_type TEXT NOT NULL,
+        occupants INTEGER NOT NULL,
+        offices INTEGER NOT NULL,
+        PRIMARY KEY (floor, appointment_type)
+    ) WITHOUT ROWID;
+    -- 'rooms' is kept current by the triggers on rooms, 'occupied_rooms' by those on office_stats
+    CREATE TABLE IF NOT EXISTS floor_summary (
+        floor INTEGER PRIMARY KEY,
+        rooms INTEGER NOT NULL DEFAULT 0,
+        occupied_rooms INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS office_stats_insert AFTER INSERT ON office_assignments BEGIN
+        INSERT INTO office_stats (office_id, appointment_type, occupants) VALUES (new.office_id, COALESCE(new.appointment_type, ''), 1)
+        ON CONFLICT (office_id, appointment_type) DO UPDATE SET occupants = occupants + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS office_stats_delete AFTER DELETE ON office_assignments BEGIN
+        UPDATE office_stats SET occupants = occupants - 1 WHERE office_id = old.office_id AND appointment_type = COALESCE(old.appointment_type, '');
+        DELETE FROM office_stats WHERE office_id = old.office_id AND appointment_type = COALESCE(old.appointment_type, '') AND occupants <= 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS office_stats_update AFTER UPDATE OF office_id, appointment_type ON office_assignments
+    WHEN old.office_id IS NOT new.office_id OR COALESCE(old.appointment_type, '') != COALESCE(new.appointment_type, '') BEGIN
+        UPDATE office_stats SET occupants = occupants - 1 WHERE office_id = old.office_id AND appointment_type = COALESCE(old.appointment_type, '');
+        DELETE FROM office_stats WHERE office_id = old.office_id AND appointment_type = COALESCE(old.appointment_type, '') AND occupants <= 0;
+        INSERT INTO office_stats (office_id, appointment_type, occupants) VALUES (new.office_id, COALESCE(new.appointment_type, ''), 1)
+        ON CONFLICT (office_id, appointment_type) DO UPDATE SET occupants = occupants + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS floor_stats_insert AFTER INSERT ON office_stats BEGIN
+        INSERT INTO floor_stats (floor, appointment_type, occupants, offices) VALUES ({floor_of('new')}, new.appointment_type, new.occupants, 1)
+        ON CONFLICT (floor, appointment_type) DO UPDATE SET occupants = occupants + excluded.occupants, offices = offices + 1;
+        -- The office's first occupant makes the room occupied
+        INSERT INTO floor_summary (floor, occupied_rooms)
+        SELECT {floor_of('new')}, 1 WHERE NOT EXISTS (
+            SELECT 1 FROM office_stats WHERE office_id = new.office_id AND appointment_type != new.appointment_type)
+        ON CONFLICT (floor) DO UPDATE SET occupied_rooms = occupied_rooms + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS floor_stats_update AFTER UPDATE OF occupants ON office_stats BEGIN
+        UPDATE floor_stats SET occupants = occupants + new.occupants - old.occupants
+        WHERE floor = {floor_of('new')} AND appointment_type = new.appointment_type;
+    END;
+    CREATE TRIGGER IF NOT EXISTS floor_stats_delete AFTER DELETE ON office_stats BEGIN
+        UPDATE floor_stats SET occupants = occupants - old.occupants, offices = offices - 1
+        WHERE floor = {floor_of('old')} AND appointment_type = old.appointment_type;
+        DELETE FROM floor_stats WHERE floor = {floor_of('old')} AND appointment_type = old.appointment_type AND offices <= 0;
+        UPDATE floor_summary SET occupied_rooms = occupied_rooms - 1
+        WHERE floor = {floor_of('old')} AND NOT EXISTS (SELECT 1 FROM office_stats WHERE office_id = old.office_id);
+        DELETE FROM floor_summary WHERE floor = {floor_of('old')} AND rooms = 0 AND occupied_rooms <= 0;
+    END;
+
+    -- An office without a room counts under UNPLACED_FLOOR; a room's office moves between that and its floor
+    CREATE TRIGGER IF NOT EXISTS rooms_stats_insert AFTER INSERT ON rooms BEGIN
+        {add_room}{move_office('new.office_id', UNPLACED_FLOOR, 'new.floor')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS rooms_stats_delete AFTER DELETE ON rooms BEGIN
+        {remove_room}{move_office('old.office_id', 'old.floor', UNPLACED_FLOOR)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS rooms_stats_update AFTER UPDATE OF office_id, floor ON rooms
+    WHEN old.office_id IS NOT new.office_id OR old.floor IS NOT new.floor BEGIN
+        {remove_room}{move_office('old.office_id', 'old.floor', UNPLACED_FLOOR)}
+        {add_room}{move_office('new.office_id', UNPLACED_FLOOR, 'new.floor')}
+    END;
+    """
+
+def rebuild_stats(db):
+    """Recomputes the stats tables from office_assignments and rooms, in the caller's transaction."""
+    db.execute('DELETE FROM office_stats')
+    db.execute('DELETE FROM floor_stats')
+    db.execute('DELETE FROM floor_summary')
+    db.execute('INSERT INTO floor_summary (floor, rooms) SELECT floor, COUNT(*) FROM rooms GROUP BY floor')
+    # Each office_stats row rolls itself up into floor_stats and floor_summary through the triggers.
+    # NOT INDEXED: one pass over the table beats walking idx_office_id with a row lookup per occupant.
+    db.execute('''
+        INSERT INTO office_stats (office_id, appointment_type, occupants)
+        SELECT office_id, COALESCE(appointment_type, ''), COUNT(*) FROM office_assignments NOT INDEXED GROUP BY 1, 2
+        ''')
+
+def ensure_stats(db):
+    """Creates the stats tables and triggers if missing, filling them from the existing data."""
+    # Databases from before the rooms triggers may have missed room changes, so they are rebuilt once too
+    current = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'rooms_stats_insert'").fetchone() is not None
+    db.executescript(stats_schema())
+    if not current:
+        rebuild_stats(db)
+        db.commit()
+
+# Rooms per floor (formerly hard-coded in office_space.js), used to seed an empty rooms table
+DEFAULT_FLOOR_ROOMS = {
+    3: ['302', '303', '303A', '304', '305', '306', '310', '319', '322A', '323', '324', '325', '326', '328', '330', '330A', '331', '332', '333', '333A', '333B', '334', '335', '336', '337', '338', '339', '340', '370', '371', '372', '375', '375A', '376', '379', '381A', '382N-A'],
+    4: ['402', '404', '405', '406', '407', '409', '412', '413', '414', '419', '420', '421', '423', '424', '425', '426', '427', '428', '429', '430', '431', '433', '434', '435', '436', '437', '438', '439', '460', '461B', '462', '463', '463A', '464', '465'],
+}
+
+def seed_rooms(db):
+    """Fills the rooms table from DEFAULT_FLOOR_ROOMS if it is empty."""
+    if db.execute('SELECT 1 FROM rooms LIMIT 1').fetchone() is None:
+        db.executemany('INSERT OR IGNORE INTO rooms (office_id, floor, sort_order) VALUES (?, ?, ?)', # Another process may be seeding too
+                       [(room_id, floor, position)
+                        for floor, room_ids in DEFAULT_FLOOR_ROOMS.items()
+                        for position, room_id in enumerate(room_ids)])
+        db.commit()
+
+# Grid used to place rooms that have no coordinates yet (formerly calculateLayout in office_space.js)
+LAYOUT_GRID = {"start_x": 50, "start_y": 50, "room_width": 100, "room_height": 100, "x_gap": 20, "y_gap": 30, "rooms_per_row": 6}
+LAYOUT_PADDING = 50 # Margin added to the right and bottom of each floor's drawing area
+ROOM_GEOMETRY_COLUMNS = ('x', 'y', 'width', 'height')
+
+def place_rooms(db):
+    """Gives rooms without coordinates their spot on their floor's LAYOUT_GRID, by sort_order. Returns how many were placed."""
+    grid = LAYOUT_GRID
+    placements = []
+    floor, position = None, 0
+    for office_id, room_floor, x in db.execute('SELECT office_id, floor, x FROM rooms ORDER BY floor, sort_order, office_id').fetchall():
+        if room_floor != floor:
+            floor, position = room_floor, 0
+        if x is None:
+            col, row = position % grid["rooms_per_row"], position // grid["rooms_per_row"]
+            placements.append((grid["start_x"] + col * (grid["room_width"] + grid["x_gap"]),
+                               grid["start_y"] + row * (grid["room_height"] + grid["y_gap"]),
+                               grid["room_width"], grid["room_height"], office_id))
+        position += 1
+    db.executemany('UPDATE rooms SET x = ?, y = ?, width = ?, height = ? WHERE office_id = ?', placements)
+    return len(placements)
+
+def ensure_room_layout(db):
+    """Adds the geometry columns to a rooms table created before they existed and places any unplaced rooms."""
+    columns = {row[1] for row in db.execute('PRAGMA table_info(rooms)').fetchall()}
+    for column in ROOM_GEOMETRY_COLUMNS:
+        if column not in columns:
+            try: db.execute(f'ALTER TABLE rooms ADD COLUMN {column} INTEGER')
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e): raise # Another process added it first
+    place_rooms(db)
+    db.commit()
+
+def ensure_occupant_versions(db):
+    """Adds the per-row version column to an office_assignments table created before it existed."""
+    columns = {row[1] for row in db.execute('PRAGMA table_info(office_assignments)').fetchall()}
+    if columns and 'version' not in columns:
+        try: db.execute('ALTER TABLE office_assignments ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e): raise # Another process added it first
+        db.commit()
+
+_support_schema_ready = False
+_support_schema_lock = threading.Lock()
+
+def ensure_support_schema(db):
+    """Creates the bookkeeping tables once per process so databases made before they existed keep working."""
+    global _support_schema_ready
+    if _support_schema_ready:
+        return
+    with _support_schema_lock:
+        # Concurrent first requests wait here; only one of them seeds and migrates
+        if _support_schema_ready:
+            return
+        db.executescript(support_schema())
+        seed_rooms(db)
+        ensure_room_layout(db)
+        try:
+            db.executescript(assignment_indexes_schema())
+            ensure_occupant_versions(db)
+            ensure_search_index(db)
+            history.ensure_history(db)
+            ensure_stats(db)
+        except sqlite3.OperationalError as e:
+            if "no such table" not in str(e): raise # Not initialized yet; 'flask init-db' creates them
+        _support_schema_ready = True
+
+# --- Data Versioning ---
+def get_data_version(db):
+    """Returns the (epoch, version) pair identifying the current state of office_assignments."""
+    row = db.execute('SELECT epoch, version FROM data_version WHERE id = 1').fetchone()
+    return (row['epoch'], row['version'])
+
+def get_layout_version(db):
+    """Returns the (epoch, layout version) pair identifying the current rooms table."""
+    row = db.execute('SELECT d.epoch, l.version FROM data_version d, layout_version l WHERE d.id = 1 AND l.id = 1').fetchone()
+    return (row[0], row[1])
+
+def get_read_versions(db):
+    """(data version, layout version) in one statement: what a cached read result must have been built at to still be current."""
+    row = db.execute('SELECT d.epoch, d.version, l.version FROM data_version d, layout_version l WHERE d.id = 1 AND l.id = 1').fetchone()
+    return ((row[0], row[1]), (row[0], row[2]))
+
+def bump_data_version(db):
+    """Marks the data as changed and returns the new version. Call inside the same transaction as the write it describes."""
+    return db.execute('UPDATE data_version SET version = version + 1 WHERE id = 1 RETURNING version').fetchall()[0][0]
+
+CHANGE_LOG_RETENTION = 10000 # Versions kept in change_log; older clients get a full reload
+
+def record_change(db, op, occupant_id=None, office_id=None):
+    """Bumps the data version and logs which occupant changed, in the caller's transaction.
+
+    (The row itself reaches assignment_history through triggers; history checkpoints are taken after the
+    write commits, see checkpoint_history_after_write.)
+    """
+    version = bump_data_version(db)
+    db.execute('INSERT INTO change_log (version, op, occupant_id, office_id) VALUES (?, ?, ?, ?)',
+               [version, op, occupant_id, office_id])
+    db.execute('DELETE FROM change_log WHERE version <= ?', [version - CHANGE_LOG_RETENTION])
+    return version
+
+# Process-wide cache of the serialized /api/offices response, keyed by data version.
+_offices_snapshot = {"key": None, "layout": None, "body": None, "etag": None, "offices": None, "variants": {}}
+_offices_snapshot_lock = threading.Lock()
 
 @app.cli.command('init-db')
 def init_db_command():
@@ -49,13 +454,106 @@ def init_db_command():
     if os.path.exists(DATABASE):
          os.remove(DATABASE) # Remove old db if exists before initializing
          print(f"Removed existing database: {DATABASE}")
+    for suffix in ('-wal', '-shm'): # WAL side files must not outlive the database they belong to
+        if os.path.exists(DATABASE + suffix):
+            os.remove(DATABASE + suffix)
 
-    conn = sqlite3.connect(DATABASE)
+    conn = db_pool.connect(DATABASE, app.config['SQLITE_SETTINGS'])
     conn.executescript(init_db_schema())
+    ensure_search_index(conn)
+    history.ensure_history(conn)
+    seed_rooms(conn)
+    ensure_room_layout(conn)
+    ensure_stats(conn) # After seeding, so floor_summary counts the rooms
     conn.commit()
     conn.close()
     print('Initialized the database with office_assignments table.')
 
+# --- Metrics ---
+# Per-route latency, per-phase time (db / materialize / serialize), rows and response sizes, served at /metrics.
+metrics_registry = metrics.Registry()
+REQUEST_SECONDS = metrics_registry.register(metrics.Histogram(
+    'office_space_request_duration_seconds', 'Time to produce a response, by route.', ('route', 'method', 'status')))
+PHASE_SECONDS = metrics_registry.register(metrics.Histogram(
+    'office_space_request_phase_seconds', 'Time per request spent executing SQL (db), building rows into dicts (materialize) and encoding JSON (serialize).', ('route', 'phase')))
+REQUEST_ROWS = metrics_registry.register(metrics.Histogram(
+    'office_space_request_rows', 'Rows fetched from SQLite per request.', ('route',), buckets=metrics.ROW_BUCKETS))
+RESPONSE_BYTES = metrics_registry.register(metrics.Histogram(
+    'office_space_response_bytes', 'Response body size (streamed responses excluded).', ('route',), buckets=metrics.BYTE_BUCKETS))
+QUERIES = metrics_registry.register(metrics.Counter(
+    'office_space_db_queries_total', 'SQL statements executed, by route.', ('route',)))
+SLOW_QUERIES = metrics_registry.register(metrics.Counter(
+    'office_space_slow_queries_total', 'Statements slower than SLOW_QUERY_SECONDS, by route.', ('route',)))
+
+def pool_stat(name, *labels):
+    """Callback reading one connection pool statistic (zero before the pool exists)."""
+    return lambda: {labels: _pool.stats()[name] if _pool is not None else 0}
+
+metrics_registry.register(metrics.Callback('office_space_db_connections_open', 'Pooled SQLite connections (in use + idle).', 'gauge', pool_stat('open')))
+metrics_registry.register(metrics.Callback('office_space_db_connections_in_use', 'SQLite connections checked out by requests.', 'gauge', pool_stat('in_use')))
+metrics_registry.register(metrics.Callback('office_space_db_connections_created_total', 'SQLite connections opened by the pool.', 'counter', pool_stat('created')))
+metrics_registry.register(metrics.Callback('office_space_db_lock_retries_total', "Write-lock retries after 'database is locked'.", 'counter', pool_stat('lock_retries')))
+
+def result_cache_stat(name):
+    """Callback reading one statistic of every result cache, labelled by cache."""
+    return lambda: {(kind,): cache.stats()[name] for kind, cache in list(_result_caches.items())}
+
+metrics_registry.register(metrics.Callback('office_space_result_cache_hits_total', 'Floor/office reads served from the process-local cache.', 'counter', result_cache_stat('hits'), ('cache',)))
+metrics_registry.register(metrics.Callback('office_space_result_cache_misses_total', 'Floor/office reads that had to query SQLite (not cached, outdated or expired).', 'counter', result_cache_stat('misses'), ('cache',)))
+metrics_registry.register(metrics.Callback('office_space_result_cache_evictions_total', 'Cached results dropped to stay within RESULT_CACHE_ENTRIES.', 'counter', result_cache_stat('evictions'), ('cache',)))
+metrics_registry.register(metrics.Callback('office_space_result_cache_entries', 'Results currently held by the process-local cache.', 'gauge', result_cache_stat('entries'), ('cache',)))
+metrics_registry.register(metrics.Callback('office_space_stream_subscribers', 'Open /api/stream connections.', 'gauge',
+                                           lambda: {(): change_broadcaster.subscriber_count()}))
+
+def route_label():
+    """The matched URL rule (e.g. /api/occupants/<int:occupant_id>) so label values stay bounded."""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def log_slow_query(sql, params, seconds):
+    SLOW_QUERIES.inc((route_label(),))
+    params = repr(params)
+    app.logger.warning(f"Slow query ({seconds * 1000:.1f} ms) on {request.method} {request.path}: "
+                       f"{' '.join(sql.split())} params={params[:200] + '...' if len(params) > 200 else params}")
+
+def timed_phase(name):
+    """Context manager adding the block's time to the current request's 'name' phase (no-op outside a request)."""
+    timings = g.get('timings') if has_request_context() else None
+    return timings.phase(name) if timings is not None else contextlib.nullcontext()
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, counting every jsonify() as the request's 'serialize' phase."""
+    def dumps(self, obj, **kwargs):
+        with timed_phase('serialize'):
+            return super().dumps(obj, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
+@app.before_request
+def start_request_timer():
+    g.timings = metrics.RequestTimings(app.config['SLOW_QUERY_SECONDS'], log_slow_query)
+
+@app.after_request
+def record_request_metrics(response):
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+    route = route_label()
+    REQUEST_SECONDS.observe((route, request.method, str(response.status_code)), time.perf_counter() - timings.started)
+    for phase, seconds in timings.phases.items():
+        PHASE_SECONDS.observe((route, phase), seconds)
+    REQUEST_ROWS.observe((route,), timings.rows)
+    if timings.queries:
+        QUERIES.inc((route,), timings.queries)
+    if not response.is_streamed:
+        RESPONSE_BYTES.observe((route,), response.calculate_content_length() or 0)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    """Prometheus scrape endpoint."""
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
 # --- HTML Route ---
 @app.route('/')
 def home():
@@ -106,19 +604,120 @@ python migrate_csv.py assignments_dates.csv
 
 @app.route('/api/offices', methods=['GET'])
 def get_offices_api():
-    """API endpoint to get all office assignments, grouped by office ID."""
+    """API endpoint to get all office assignments, grouped by office ID.
+
+    With ?as_of=YYYY-MM-DD only assignments active on that date are returned (not cached).
+    With ?at=<ISO 8601 timestamp> the assignments as recorded at that moment are returned (see history.py).
+    """
+    if 'as_of' in request.args and 'at' in request.args:
+        return jsonify({"error": "Use either 'as_of' or 'at', not both"}), 400
+    if 'as_of' in request.args:
+        return get_offices_as_of_api(request.args['as_of'])
+    if 'at' in request.args:
+        return get_offices_at_api(request.args['at'])
+
     db = get_db()
+    try:
+        snapshot = get_offices_snapshot(db)
+        representation, encoding = negotiate_representation(), negotiate_encoding()
+        body, etag, encoding = snapshot_variant(snapshot, representation, encoding)
+        response = encoded_response(body, representation, encoding)
+        response.set_etag(etag)
+        set_data_version_headers(response, snapshot["key"]) # Base version for incremental updates via /api/changes
+        set_layout_version_header(response, snapshot["layout"])
+        response.headers['Cache-Control'] = 'no-cache' # Always revalidate; unchanged data costs a 304
+        return response.make_conditional(request)
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching offices: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching offices: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+def get_offices_snapshot(db):
+    """Returns the cached {key, layout, body, etag} snapshot for /api/offices, rebuilding it only when the data or layout version moved."""
+    global _offices_snapshot
+    key, layout = get_read_versions(db)
+    snapshot = _offices_snapshot
+    if snapshot["key"] == key and snapshot["layout"] == layout:
+        return snapshot
+
+    with _offices_snapshot_lock:
+        # Another request may have rebuilt it while we waited for the lock
+        if _offices_snapshot["key"] == key and _offices_snapshot["layout"] == layout:
+            return _offices_snapshot
+
+        # Read the versions and the rows in one read transaction so they agree
+        db.execute('BEGIN')
+        try:
+            key, layout = get_read_versions(db)
+            offices_response = build_offices_response(db)
+        finally:
+            db.rollback()
+
+        with timed_phase('serialize'):
+            body = json.dumps(offices_response, sort_keys=True, separators=(',', ':')).encode('utf-8')
+            etag = f"{key[0]}-{key[1]}-{hashlib.sha1(body).hexdigest()[:16]}"
+        # Swap in a new dict so readers outside the lock never see a half-updated snapshot
+        _offices_snapshot = {"key": key, "layout": layout, "body": body, "etag": etag, "offices": offices_response,
+                             "variants": {}} # (representation, encoding) -> (body, etag); see snapshot_variant
+        return _offices_snapshot
+
+
+# Columns selected wherever an occupant row is turned into API output
+OCCUPANT_COLUMNS = 'id, office_id, full_name, appointment_type, start_date, end_date, is_temporary, version'
+# Same shape from office_assignments_archive; archived occupants can't be edited, so they have no version
+ARCHIVED_OCCUPANT_COLUMNS = 'id, office_id, full_name, appointment_type, start_date, end_date, is_temporary, NULL AS version'
+
+# Occupant fields in API output -> office_assignments column they come from
+OCCUPANT_FIELDS = {
+    "occupant_id": "id",
+    "full_name": "full_name",
+    "appointment_type": "appointment_type",
+    "start_date": "start_date",
+    "end_date": "end_date",
+    "temporary": "is_temporary",
+    "version": "version",
+}
+
+def occupant_to_dict(row, fields=None):
+    """Maps an office_assignments row to the occupant structure used by the JSON API.
+
+    'fields' optionally restricts the output to those OCCUPANT_FIELDS keys (see parse_fields_param).
+    """
+    if fields is not None:
+        return {field: bool(row['is_temporary']) if field == 'temporary' else row[OCCUPANT_FIELDS[field]]
+                for field in fields}
+    return {
+        "occupant_id": row['id'], # Use 'id' from DB as 'occupant_id'
+        "full_name": row['full_name'],
+        "appointment_type": row['appointment_type'],
+        "start_date": row['start_date'],
+        "end_date": row['end_date'],
+        "temporary": bool(row['is_temporary']),
+        "version": row['version'],
+        # Note: We don't need area_name inside each occupant anymore
+    }
+
+
+def build_offices_response(db):
+    """Builds the {office_id: {"occupants": [...]}} structure served by /api/offices, including rooms nobody occupies."""
     # Use a dictionary to build the response structure
     offices_response = {}
-    try:
-        cur = db.execute('''
-                        SELECT id, office_id, full_name, appointment_type, start_date, end_date, is_temporary
-                        FROM office_assignments
-                        ORDER BY office_id, id
-                        ''')
-        rows = cur.fetchall()
+    cur = db.execute(f'''
+                    SELECT {OCCUPANT_COLUMNS}
+                    FROM office_assignments
+                    ORDER BY office_id, id
+                    ''')
+    rows = cur.fetchall()
 
-        # Process rows to build the desired structure
+    # Process rows to build the desired structure
+    with timed_phase('materialize'):
         for row in rows:
             office_id = row['office_id']
 
@@ -129,60 +728,933 @@ def get_offices_api():
                     "occupants": []
                 }
 
-            # Prepare occupant details
-            occupant_dict = {
-                "occupant_id": row['id'], # Use 'id' from DB as 'occupant_id'
-                "full_name": row['full_name'],
-                "appointment_type": row['appointment_type'],
-                "start_date": row['start_date'],
-                "end_date": row['end_date'],
-                "temporary": bool(row['is_temporary'])
-                # Note: We don't need area_name inside each occupant anymore
-            }
-            offices_response[office_id]["occupants"].append(occupant_dict)
-
-        # TODO (Optional Enhancement): Add empty offices from layout definitions
-        # if they weren't in the database. This requires access to the room lists
-        # (thirdFloorRooms, fourthFloorRooms) here or modifying the migration
-        # script to ensure all rooms exist in the DB, potentially with NULL area_name.
-        # Example:
-        # all_defined_rooms = set(thirdFloorRooms + fourthFloorRooms) # Needs access to these lists
-        # for room_id in all_defined_rooms:
-        #    if room_id not in offices_response:
-        #        # Need a way to get area_name for empty rooms if migration didn't add them
-        #        # area = get_area_logic_here(room_id) # Requires repeating or importing logic
-        #        offices_response[room_id] = {"occupants": []}
-
-        return jsonify(offices_response) # Return the new structure
+            offices_response[office_id]["occupants"].append(occupant_to_dict(row))
+
+    # Rooms with no occupants: an anti-join probing idx_office_id once per room
+    empty_rooms = db.execute('''
+        SELECT office_id FROM rooms r
+        WHERE NOT EXISTS (SELECT 1 FROM office_assignments a WHERE a.office_id = r.office_id)
+        ''').fetchall()
+    for row in empty_rooms:
+        offices_response[row['office_id']] = {"occupants": []}
+
+    return offices_response
+
+
+# --- Compact Wire Format ---
+# Clients that send 'Accept: application/vnd.office-space.columnar+json' get each office's occupants as
+# parallel columns instead of one object per occupant. A column that is entirely null (or, for
+# 'temporary', entirely false) is sent as null, and appointment types are indexes into a shared list.
+COLUMNAR_MIMETYPE = 'application/vnd.office-space.columnar+json'
+COLUMNAR_FORMAT = 'columnar-v1'
+MIN_COMPRESS_BYTES = 1024 # Smaller bodies go out uncompressed
+BROTLI_QUALITY = 6        # 11 takes seconds on large snapshots for a few percent more
+
+def columnar_occupants(occupants, fields, appointment_types):
+    """Occupant dicts -> one list per field (None if the column carries nothing). Returns None for an empty office.
+
+    'appointment_types' maps type string -> index and is extended as new types are seen.
+    """
+    if not occupants:
+        return None
+    columns = []
+    for field in fields:
+        values = [occupant[field] for occupant in occupants]
+        if field == 'appointment_type':
+            values = [None if value is None else appointment_types.setdefault(value, len(appointment_types)) for value in values]
+        elif field == 'temporary':
+            values = [int(value) for value in values]
+            if not any(values):
+                values = [None]
+        columns.append(values if any(value is not None for value in values) else None)
+    return columns
+
+def columnar_document(offices, fields):
+    """Columnar form of either {office_id: {"occupants": [...]}} (/api/offices) or a list of
+    {"office_id", "occupants"} (floor view, which becomes a list of [office_id, columns] pairs)."""
+    appointment_types = {}
+    if isinstance(offices, dict):
+        encoded = {office_id: columnar_occupants(office["occupants"], fields, appointment_types)
+                   for office_id, office in offices.items()}
+    else:
+        encoded = [[office["office_id"], columnar_occupants(office["occupants"], fields, appointment_types)]
+                   for office in offices]
+    return {"format": COLUMNAR_FORMAT, "columns": fields, "appointment_types": list(appointment_types), "offices": encoded}
+
+def negotiate_representation():
+    """'columnar' if the client prefers COLUMNAR_MIMETYPE over plain JSON, else 'json'."""
+    best = request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE], default='application/json')
+    return 'columnar' if best == COLUMNAR_MIMETYPE else 'json'
+
+def negotiate_encoding():
+    """The client's preferred content encoding among those available: 'br' (if brotli is installed), 'gzip' or 'identity'."""
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best = max(available, key=lambda encoding: request.accept_encodings.quality(encoding))
+    return best if request.accept_encodings.quality(best) > 0 else 'identity'
+
+def compress_body(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6, mtime=0) # mtime=0 keeps the bytes (and ETag) stable
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return body
+
+def encode_json(payload):
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def compress_payload(payload_body, encoding):
+    """(body, encoding used) for an already serialized body, compressed with 'encoding' when it's worth it."""
+    if len(payload_body) < MIN_COMPRESS_BYTES:
+        return payload_body, 'identity'
+    with timed_phase('serialize'):
+        return compress_body(payload_body, encoding), encoding
+
+def encoded_response(body, representation, encoding):
+    """Response for a body already serialized and compressed (see compress_payload)."""
+    response = app.response_class(body, mimetype=COLUMNAR_MIMETYPE if representation == 'columnar' else 'application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+def snapshot_variant(snapshot, representation, encoding):
+    """(body, etag, encoding) of one representation/encoding of an /api/offices snapshot, built on first request and kept with it."""
+    if encoding != 'identity' and len(snapshot["body"]) < MIN_COMPRESS_BYTES:
+        encoding = 'identity'
+    variant = snapshot["variants"].get((representation, encoding))
+    if variant is None:
+        # Racing requests may both build it; the results are identical and the dict assignment is atomic
+        with timed_phase('serialize'):
+            if encoding != 'identity':
+                body = snapshot_variant(snapshot, representation, 'identity')[0]
+                body = compress_body(body, encoding)
+            elif representation == 'columnar':
+                body = encode_json(columnar_document(snapshot["offices"], list(OCCUPANT_FIELDS)))
+            else:
+                body = snapshot["body"]
+        suffix = ('' if representation == 'json' else '-columnar') + ('' if encoding == 'identity' else f'-{encoding}')
+        variant = snapshot["variants"][(representation, encoding)] = (body, snapshot["etag"] + suffix, encoding)
+    return variant
+
+
+# --- Scoped Reads (per floor / per office) ---
+# Encoded responses are cached per process in a ResultCache per kind, tagged with the (data, layout) versions
+# they were read at. Each request reads the current versions (one statement) and serves from memory when
+# they match, so writes by other workers or migrate_csv.py are seen on the very next request.
+_result_caches = {}
+_result_caches_lock = threading.Lock()
+
+def get_result_cache(kind):
+    """The process-wide ResultCache for 'floor' or 'office' results, created from app.config on first use."""
+    cache = _result_caches.get(kind)
+    if cache is None:
+        with _result_caches_lock:
+            cache = _result_caches.get(kind)
+            if cache is None:
+                cache = _result_caches[kind] = result_cache.ResultCache(app.config['RESULT_CACHE_ENTRIES'],
+                                                                        app.config['RESULT_CACHE_TTL'])
+    return cache
+
+def cached_read(kind, cache_key, db, build):
+    """build(db)'s result for cache_key, reused while the data and layout versions stay where they were.
+
+    'build' returns a dict with the "versions" it read the rows at (inside its read transaction), which
+    may be newer than the ones checked here; the result is stored under those.
+    """
+    cache = get_result_cache(kind)
+    result = cache.get(cache_key, get_read_versions(db))
+    if result is None:
+        result = build(db)
+        cache.put(cache_key, result["versions"], result)
+    return result
+
+def parse_fields_param():
+    """Reads ?fields=a,b from the request. Returns (field list or None for all fields, error message).
+
+    'occupant_id' is always included so clients can still address the occupant.
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return None, None
+    fields = ['occupant_id']
+    for field in (f.strip() for f in raw.split(',')):
+        if field not in OCCUPANT_FIELDS:
+            return None, f"Unknown field '{field}'. Valid fields: {', '.join(OCCUPANT_FIELDS)}"
+        if field not in fields:
+            fields.append(field)
+    return fields, None
+
+
+def projected_columns(fields):
+    """SQL column list for the occupant fields being returned, prefixed with the assignments alias 'a'."""
+    columns = OCCUPANT_FIELDS.values() if fields is None else (OCCUPANT_FIELDS[f] for f in fields)
+    return ', '.join(f'a.{column}' for column in columns)
+
+
+def layout_version_string(layout_key):
+    return f"{layout_key[0]}-{layout_key[1]}"
+
+def set_layout_version_header(response, layout_key):
+    """Adds X-Layout-Version, which clients pass as /api/layout?v= to fetch (and cache) the matching floor plan."""
+    response.headers['X-Layout-Version'] = layout_version_string(layout_key)
+    return response
+
+def set_data_version_headers(response, key):
+    """Adds the X-Data-Epoch/X-Data-Version headers clients use as a base for /api/changes."""
+    response.headers['X-Data-Epoch'] = key[0]
+    response.headers['X-Data-Version'] = str(key[1])
+    return response
+
+
+LAYOUT_MAX_AGE = 365 * 24 * 3600 # Seconds browsers may keep a versioned /api/layout?v= response
+
+# Process-wide cache of the serialized /api/layout response, keyed by layout version
+_layout_cache = {"key": None, "body": None}
+
+def build_layout(db):
+    """Every floor with its drawing size and its rooms' positions, in display order.
+
+    Returns None if a room has no coordinates yet (inserted after startup); place_new_rooms() places it.
+    """
+    floors = []
+    rows = db.execute('SELECT office_id, floor, x, y, width, height FROM rooms ORDER BY floor, sort_order, office_id').fetchall()
+    for row in rows:
+        if row['x'] is None:
+            return None
+        if not floors or floors[-1]["floor"] != row['floor']:
+            floors.append({"floor": row['floor'], "width": 0, "height": 0, "rooms": []})
+        floor = floors[-1]
+        floor["rooms"].append({"office_id": row['office_id'], "x": row['x'], "y": row['y'], "width": row['width'], "height": row['height']})
+        floor["width"] = max(floor["width"], row['x'] + row['width'] + LAYOUT_PADDING)
+        floor["height"] = max(floor["height"], row['y'] + row['height'] + LAYOUT_PADDING)
+    return floors
+
+def place_new_rooms(db):
+    """Puts rooms inserted since startup (e.g. from a sqlite3 shell) on the grid, in a write transaction.
+
+    Bumps the layout version through the rooms triggers, so every process rebuilds its layout.
+    """
+    begin_write(db)
+    try:
+        placed = place_rooms(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    app.logger.info(f"Placed {placed} new room(s) on the layout grid")
+
+@app.route('/api/layout', methods=['GET'])
+def get_layout_api():
+    """API endpoint with the floor plan: every floor's rooms with their coordinates and sizes.
+
+    The geometry only changes with the rooms table. Requested as /api/layout?v=<X-Layout-Version from an
+    offices or floor response> it may be cached for a year, since any change produces a new version.
+    """
+    global _layout_cache
+    db = get_db()
+    try:
+        layout = get_layout_version(db)
+        cached = _layout_cache
+        if cached["key"] != layout:
+            while True:
+                db.execute('BEGIN')
+                try:
+                    layout = get_layout_version(db)
+                    floors = build_layout(db)
+                finally:
+                    db.rollback()
+                if floors is not None:
+                    break
+                place_new_rooms(db) # Then read again at the version the placement produced
+            with timed_phase('serialize'):
+                body = encode_json({"version": layout_version_string(layout), "floors": floors})
+            cached = _layout_cache = {"key": layout, "body": body}
+
+        response = app.response_class(cached["body"], mimetype='application/json')
+        set_layout_version_header(response, layout)
+        response.set_etag(f"layout-{layout_version_string(layout)}")
+        if request.args.get('v') == layout_version_string(layout):
+            response.headers['Cache-Control'] = f'public, max-age={LAYOUT_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache' # Unversioned (or outdated) URL: always revalidate
+        return response.make_conditional(request)
 
     except sqlite3.OperationalError as e:
          if "no such table" in str(e):
               return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
          else:
-              app.logger.error(f"Database error fetching offices: {e}")
+              app.logger.error(f"Database error fetching layout: {e}")
               return jsonify({"error": "Database error", "details": str(e)}), 500
     except Exception as e:
-        app.logger.error(f"Unexpected error fetching offices: {e}")
+        app.logger.error(f"Unexpected error fetching layout: {e}")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 
-@app.route('/api/offices/<string:office_id>/occupants', methods=['POST'])
-def add_occupant_api(office_id):
-    """API endpoint to add a new occupant to a specific office."""
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
+def build_floor_result(db, floor, fields, representation, encoding):
+    """Reads and encodes one floor: {"versions", "body" (None if the floor has no rooms), "encoding"}."""
+    # Read the versions and the rows in one read transaction so they agree
+    db.execute('BEGIN')
+    try:
+        versions = get_read_versions(db)
+        # idx_rooms_floor picks the floor's rooms; idx_office_id joins their occupants
+        cur = db.execute(f'''
+            SELECT r.office_id AS room_id, {projected_columns(fields)}
+            FROM rooms r
+            LEFT JOIN office_assignments a ON a.office_id = r.office_id
+            WHERE r.floor = ?
+            ORDER BY r.sort_order, r.office_id, a.id
+            ''', [floor])
+        rows = cur.fetchall()
+        offices = []
+        with timed_phase('materialize'):
+            for row in rows:
+                if not offices or offices[-1]["office_id"] != row['room_id']:
+                    offices.append({"office_id": row['room_id'], "occupants": []})
+                if row['id'] is not None:
+                    offices[-1]["occupants"].append(occupant_to_dict(row, fields))
+    finally:
+        db.rollback()
 
-    data = request.get_json()
+    if not offices:
+        return {"versions": versions, "body": None, "encoding": 'identity'}
+    with timed_phase('serialize'):
+        if representation == 'columnar':
+            body = encode_json({"floor": floor, **columnar_document(offices, fields or list(OCCUPANT_FIELDS))})
+        else:
+            body = encode_json({"floor": floor, "offices": offices})
+    body, encoding = compress_payload(body, encoding)
+    return {"versions": versions, "body": body, "encoding": encoding}
+
+@app.route('/api/floors/<int:floor>/offices', methods=['GET'])
+def get_floor_offices_api(floor):
+    """API endpoint for one floor: every room on it, in display order, with its occupants (possibly none).
+
+    Optional ?fields=full_name,end_date,... limits the occupant fields returned.
+    """
+    fields, error = parse_fields_param()
+    if error:
+        return jsonify({"error": error}), 400
+
+    db = get_db()
+    try:
+        representation, encoding = negotiate_representation(), negotiate_encoding()
+        result = cached_read('floor', (floor, tuple(fields or ()), representation, encoding), db,
+                             lambda db: build_floor_result(db, floor, fields, representation, encoding))
+        if result["body"] is None:
+            return jsonify({"error": f"Floor {floor} not found"}), 404
+        key, layout = result["versions"]
+        response = set_data_version_headers(encoded_response(result["body"], representation, result["encoding"]), key)
+        return set_layout_version_header(response, layout)
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching floor {floor}: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching floor {floor}: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+def build_office_result(db, office_id, fields):
+    """Reads and encodes one office: {"versions", "body" (None if there's no such room and nobody in it)}."""
+    db.execute('BEGIN')
+    try:
+        versions = get_read_versions(db)
+        room = db.execute('SELECT floor FROM rooms WHERE office_id = ?', [office_id]).fetchone()
+        cur = db.execute(f'''
+            SELECT {projected_columns(fields)} FROM office_assignments a
+            WHERE a.office_id = ? ORDER BY a.id
+            ''', [office_id])
+        rows = cur.fetchall()
+        with timed_phase('materialize'):
+            occupants = [occupant_to_dict(row, fields) for row in rows]
+    finally:
+        db.rollback()
+
+    if room is None and not occupants:
+        return {"versions": versions, "body": None}
+    with timed_phase('serialize'):
+        body = encode_json({"office_id": office_id, "floor": room['floor'] if room else None, "occupants": occupants})
+    return {"versions": versions, "body": body}
+
+@app.route('/api/offices/<string:office_id>', methods=['GET'])
+def get_office_api(office_id):
+    """API endpoint for a single office's occupants. Supports ?fields= like the floor endpoint."""
+    fields, error = parse_fields_param()
+    if error:
+        return jsonify({"error": error}), 400
+
+    db = get_db()
+    try:
+        result = cached_read('office', (office_id, tuple(fields or ())), db,
+                             lambda db: build_office_result(db, office_id, fields))
+        if result["body"] is None:
+            return jsonify({"error": "Office not found"}), 404
+        return set_data_version_headers(app.response_class(result["body"], mimetype='application/json'), result["versions"][0])
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching office {office_id}: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching office {office_id}: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+# --- Occupant Search ---
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+def fts_prefix_query(text):
+    """Turns free text into an FTS5 query where every word must match as a prefix: 'tra sa' -> '"tra"* "sa"*'."""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text))
+
+
+@app.route('/api/search', methods=['GET'])
+def search_api():
+    """API endpoint for finding occupants by name or appointment type.
+
+    ?q= matches every word as a prefix, ignoring case and accents; results are ranked (name matches
+    first) and capped by ?limit= (default SEARCH_DEFAULT_LIMIT, at most SEARCH_MAX_LIMIT).
+    """
+    query = fts_prefix_query(request.args.get('q', ''))
+    if not query:
+        return jsonify({"error": "Missing 'q' parameter"}), 400
+    limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
+    if limit is None or not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return jsonify({"error": f"'limit' must be between 1 and {SEARCH_MAX_LIMIT}"}), 400
+
+    db = get_db()
+    try:
+        cur = db.execute(f'''
+            SELECT {projected_columns(None)}, a.office_id, r.floor
+            FROM occupant_search s
+            JOIN office_assignments a ON a.id = s.rowid
+            LEFT JOIN rooms r ON r.office_id = a.office_id
+            WHERE occupant_search MATCH ?
+            ORDER BY s.rank
+            LIMIT ?
+            ''', [query, limit])
+        rows = cur.fetchall()
+        with timed_phase('materialize'):
+            results = [{"office_id": row['office_id'], "floor": row['floor'], "occupant": occupant_to_dict(row)} for row in rows]
+        return jsonify({"q": request.args['q'], "results": results})
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error searching occupants: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error searching occupants: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+# --- Date-Range Planning Queries ---
+def parse_iso_date(value):
+    """Parses a YYYY-MM-DD query parameter. Returns a date, or None if it is malformed."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_offices_as_of_api(as_of_param):
+    """Occupants whose assignment covers the given date, grouped by office like /api/offices (empty rooms included)."""
+    as_of = parse_iso_date(as_of_param)
+    if as_of is None:
+        return jsonify({"error": "Invalid 'as_of' date, expected YYYY-MM-DD"}), 400
+
+    db = get_db()
+    try:
+        # Most assignments cover any given date (permanent occupants have end_date NULL), so a date index
+        # doesn't help here: walking idx_office_id delivers the rows already in output order.
+        # Expired occupants moved to the archive still covered past dates; idx_archive_end_start finds
+        # them, and for today or later that range is empty.
+        day = as_of.isoformat()
+        cur = db.execute(f'''
+            SELECT {OCCUPANT_COLUMNS} FROM office_assignments
+            WHERE (end_date IS NULL OR end_date >= ?) AND (start_date IS NULL OR start_date <= ?)
+            UNION ALL
+            SELECT {ARCHIVED_OCCUPANT_COLUMNS} FROM office_assignments_archive
+            WHERE end_date >= ? AND (start_date IS NULL OR start_date <= ?)
+            ORDER BY office_id, id
+            ''', [day, day, day, day])
+
+        rows = cur.fetchall()
+        rooms = db.execute('SELECT office_id FROM rooms').fetchall()
+        offices_response = {}
+        with timed_phase('materialize'):
+            for row in rows:
+                offices_response.setdefault(row['office_id'], {"occupants": []})["occupants"].append(occupant_to_dict(row))
+            for row in rooms: # Rooms nobody occupied on that date, so the shape matches /api/offices
+                offices_response.setdefault(row['office_id'], {"occupants": []})
+        return jsonify(offices_response)
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching offices as of {as_of}: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching offices as of {as_of}: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+def parse_timestamp(value):
+    """Parses an ISO 8601 date or date-time query parameter (no offset means UTC). Returns an aware datetime, or None."""
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+# History doesn't record row versions, so past states are served without them
+HISTORICAL_FIELDS = [field for field in OCCUPANT_FIELDS if field != 'version']
+
+def get_offices_at_api(at_param):
+    """Occupants as they were at a past moment, grouped by office like /api/offices, rebuilt from the history tables."""
+    at = parse_timestamp(at_param)
+    if at is None:
+        return jsonify({"error": "Invalid 'at' timestamp, expected ISO 8601 (e.g. 2024-05-01T17:00:00Z)"}), 400
+
+    db = get_db()
+    try:
+        db.execute('BEGIN') # Checkpoint and events read from one snapshot
+        try:
+            rows = history.state_at(db, history.format_timestamp(at))
+        finally:
+            db.rollback()
+        if rows is None:
+            return jsonify({"error": "No history recorded before that time"}), 404
+
+        offices_response = {}
+        with timed_phase('materialize'):
+            for row in rows:
+                offices_response.setdefault(row['office_id'], {"occupants": []})["occupants"].append(occupant_to_dict(row, HISTORICAL_FIELDS))
+        return jsonify(offices_response)
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching offices at {at_param}: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching offices at {at_param}: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+VACANCY_WINDOW_DAYS = 30 # Default look-ahead for /api/vacancies
+
+@app.route('/api/vacancies', methods=['GET'])
+def get_vacancies_api():
+    """API endpoint listing offices with occupants leaving between 'from' and 'to' (inclusive).
+
+    Defaults to today through VACANCY_WINDOW_DAYS ahead. For each office it returns the departing
+    occupants, how many occupants remain after 'to', and 'vacant_from' (the day after the last
+    departure) when the office ends up empty.
+    """
+    start = parse_iso_date(request.args.get('from')) if 'from' in request.args else date.today()
+    if start is None:
+        return jsonify({"error": "Invalid 'from' date, expected YYYY-MM-DD"}), 400
+    end = parse_iso_date(request.args.get('to')) if 'to' in request.args else start + timedelta(days=VACANCY_WINDOW_DAYS)
+    if end is None:
+        return jsonify({"error": "Invalid 'to' date, expected YYYY-MM-DD"}), 400
+    if end < start:
+        return jsonify({"error": "'to' must not be before 'from'"}), 400
+
+    db = get_db()
+    try:
+        # Range scans on idx_assignments_end_start and idx_archive_end_start: only assignments ending inside
+        # the window are read, including expired ones already archived (past windows)
+        cur = db.execute(f'''
+            SELECT {OCCUPANT_COLUMNS} FROM office_assignments
+            WHERE end_date BETWEEN ? AND ?
+            UNION ALL
+            SELECT {ARCHIVED_OCCUPANT_COLUMNS} FROM office_assignments_archive
+            WHERE end_date BETWEEN ? AND ?
+            ORDER BY office_id, end_date, id
+            ''', [start.isoformat(), end.isoformat()] * 2)
+        rows = cur.fetchall()
+        offices = {}
+        with timed_phase('materialize'):
+            for row in rows:
+                offices.setdefault(row['office_id'], {"departing": [], "remaining": 0, "vacant_from": None})["departing"].append(occupant_to_dict(row))
+
+        if offices:
+            # Occupants still assigned after the window, counted only for the affected offices (idx_office_id).
+            # Archived ones count when the window is in the past and they left after it.
+            placeholders = ','.join('?' * len(offices))
+            cur = db.execute(f'''
+                SELECT office_id, COUNT(*) AS remaining FROM (
+                    SELECT office_id FROM office_assignments
+                    WHERE office_id IN ({placeholders}) AND (end_date IS NULL OR end_date > ?)
+                    UNION ALL
+                    SELECT office_id FROM office_assignments_archive
+                    WHERE end_date > ? AND office_id IN ({placeholders})
+                )
+                GROUP BY office_id
+                ''', [*offices, end.isoformat(), end.isoformat(), *offices])
+            for row in cur.fetchall():
+                offices[row['office_id']]["remaining"] = row['remaining']
+
+        for office in offices.values():
+            if office["remaining"] == 0:
+                last_departure = date.fromisoformat(office["departing"][-1]["end_date"])
+                office["vacant_from"] = (last_departure + timedelta(days=1)).isoformat()
+
+        return jsonify({"from": start.isoformat(), "to": end.isoformat(), "offices": offices})
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching vacancies: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching vacancies: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes_api():
+    """API endpoint returning occupant inserts, updates and deletions since a client-supplied version.
+
+    Clients pass the X-Data-Epoch/X-Data-Version they last saw (from /api/offices or a previous call).
+    If the log can't bridge the gap the response has "reset": true and the client should refetch /api/offices.
+    """
+    since = request.args.get('since', type=int)
+    epoch = request.args.get('epoch')
+    if since is None:
+        return jsonify({"error": "Missing or invalid 'since' parameter"}), 400
+
+    db = get_db()
+    try:
+        # Read the version and the log in one read transaction so they agree
+        db.execute('BEGIN')
+        try:
+            current_epoch, current_version = get_data_version(db)
+            response = {"epoch": current_epoch, "version": current_version, "reset": False, "changes": []}
+
+            if (epoch and epoch != current_epoch) or since > current_version:
+                response["reset"] = True # Database was re-created since the client's snapshot
+            elif since < current_version:
+                oldest = db.execute('SELECT MIN(version) FROM change_log').fetchone()[0]
+                bulk_write = db.execute("SELECT 1 FROM change_log WHERE version > ? AND op = 'reset' LIMIT 1", [since]).fetchone()
+                if oldest is None or since < oldest - 1 or bulk_write:
+                    response["reset"] = True # Log trimmed past the client's version, or a bulk import happened
+                else:
+                    response["changes"] = collect_changes(db, since)
+        finally:
+            db.rollback()
+        return jsonify(response)
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching changes: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching changes: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+def collect_changes(db, since):
+    """Collapses change_log entries after 'since' into one net change per occupant."""
+    cur = db.execute('''
+        SELECT latest.occupant_id, latest.change_version, latest.created, log.office_id AS logged_office_id,
+               a.id, a.office_id, a.full_name, a.appointment_type, a.start_date, a.end_date, a.is_temporary, a.version
+        FROM (SELECT occupant_id, MAX(version) AS change_version, MAX(op = 'insert') AS created
+              FROM change_log
+              WHERE version > ? AND occupant_id IS NOT NULL
+              GROUP BY occupant_id) AS latest
+        JOIN change_log log ON log.version = latest.change_version
+        LEFT JOIN office_assignments a ON a.id = latest.occupant_id
+        ORDER BY latest.change_version
+        ''', [since])
+
+    rows = cur.fetchall()
+
+    changes = []
+    with timed_phase('materialize'):
+        for row in rows:
+            if row['id'] is None:
+                if row['created']:
+                    continue # Added and removed again since 'since': the client never saw it
+                changes.append(change_entry('delete', row['change_version'], row['occupant_id'], row['logged_office_id']))
+            else:
+                changes.append(change_entry('insert' if row['created'] else 'update', row['change_version'],
+                                            row['id'], row['office_id'], occupant_to_dict(row)))
+    return changes
+
+
+def change_entry(op, version, occupant_id, office_id, occupant=None):
+    """Builds one change record as served by /api/changes and /api/stream."""
+    entry = {"op": op, "version": version, "occupant_id": occupant_id, "office_id": office_id}
+    if occupant is not None:
+        entry["occupant"] = occupant
+    return entry
+
+
+# --- Occupancy Stats ---
+def occupancy_summary(rooms, occupied_rooms, type_rows):
+    """Counts for one floor (or the whole building) from its room counts and (appointment_type, occupants, offices) rows."""
+    return {
+        "rooms": rooms,
+        "occupied_rooms": occupied_rooms,
+        "vacant_rooms": max(rooms - occupied_rooms, 0),
+        "occupancy_rate": round(occupied_rooms / rooms, 4) if rooms else None,
+        "occupants": sum(occupants for _, occupants, _ in type_rows),
+        "appointment_types": [{"appointment_type": appointment_type or None, "occupants": occupants, "offices": offices}
+                              for appointment_type, occupants, offices in type_rows],
+    }
+
+@app.route('/api/stats', methods=['GET'])
+def stats_api():
+    """API endpoint with occupancy per floor, per appointment type and for the building, read from the stats tables only.
+
+    Free capacity is reported as vacant rooms (rooms have no seat count). Occupants of offices missing
+    from the rooms table are listed under floor null.
+    """
+    db = get_db()
+    try:
+        db.execute('BEGIN') # Version and summary from the same snapshot
+        try:
+            key, layout = get_read_versions(db) # Room changes move counts between floors too
+            summaries = db.execute('SELECT floor, rooms, occupied_rooms FROM floor_summary ORDER BY floor').fetchall()
+            type_rows = db.execute('SELECT floor, appointment_type, occupants, offices FROM floor_stats ORDER BY floor, appointment_type').fetchall()
+        finally:
+            db.rollback()
+
+        types_by_floor = {}
+        building_types = {}
+        for row in type_rows:
+            types_by_floor.setdefault(row['floor'], []).append((row['appointment_type'], row['occupants'], row['offices']))
+            totals = building_types.setdefault(row['appointment_type'], [0, 0])
+            totals[0] += row['occupants']
+            totals[1] += row['offices']
+
+        floors = []
+        for row in summaries:
+            floor = None if row['floor'] == UNPLACED_FLOOR else row['floor']
+            floors.append({"floor": floor, **occupancy_summary(row['rooms'], row['occupied_rooms'], types_by_floor.get(row['floor'], []))})
+        building = occupancy_summary(sum(row['rooms'] for row in summaries), sum(row['occupied_rooms'] for row in summaries),
+                                     [(appointment_type, occupants, offices) for appointment_type, (occupants, offices) in sorted(building_types.items())])
+
+        response = jsonify({"floors": floors, "building": building})
+        set_data_version_headers(response, key)
+        response.set_etag(f'stats-{key[0]}-{key[1]}-{layout[1]}')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         else:
+              app.logger.error(f"Database error fetching stats: {e}")
+              return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error fetching stats: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+# --- Live Updates (Server-Sent Events) ---
+change_broadcaster = change_stream.ChangeBroadcaster()
+
+def publish_change(entry):
+    """Pushes a committed change to /api/stream subscribers. Call only after db.commit()."""
+    change_broadcaster.publish(entry)
+
+# --- History Checkpoints ---
+# A checkpoint copies all of office_assignments under the write lock, so no request's write transaction
+# pays for it: after a successful write request one cheap query checks whether one is due, and if so a
+# background thread takes it in its own short transaction (one thread at a time per process).
+_checkpoint_running = threading.Lock()
+
+def checkpoint_history(db):
+    """Takes a history checkpoint if one is due, in its own write transaction. Returns True if it took one."""
+    begin_write(db)
+    try:
+        taken = history.maybe_checkpoint(db)
+        db.commit()
+        return taken
+    except Exception:
+        db.rollback()
+        raise
+
+def run_history_checkpoint():
+    conn = get_pool().acquire()
+    try:
+        checkpoint_history(conn)
+    except Exception as e:
+        app.logger.error(f"Error taking history checkpoint: {e}")
+    finally:
+        get_pool().release(conn)
+        _checkpoint_running.release()
+
+@app.after_request
+def checkpoint_history_after_write(response):
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400 and 'db' in g:
+        try:
+            due = history.checkpoint_due(g.db)
+        except sqlite3.OperationalError:
+            due = False # History tables not created yet
+        if due and _checkpoint_running.acquire(blocking=False):
+            threading.Thread(target=run_history_checkpoint, name='history-checkpoint', daemon=True).start()
+    return response
+
+def read_data_version():
+    """Reads the current (epoch, version) on a pooled connection, for use outside a request."""
+    conn = get_pool().acquire()
+    try:
+        return get_data_version(conn)
+    finally:
+        get_pool().release(conn)
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream_api():
+    """Server-Sent Events stream of occupant changes as the mutation routes commit them."""
+    try:
+        get_data_version(get_db()) # Fail fast with a JSON error rather than a broken stream
+    except sqlite3.OperationalError as e:
+        app.logger.error(f"Database error opening change stream: {e}")
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+
+    response = Response(change_stream.stream_events(change_broadcaster, read_data_version),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Don't let a reverse proxy buffer the stream
+    return response
+
+
+# --- Bulk Export ---
+EXPORT_CHUNK_SIZE = 1000 # Rows fetched from the cursor and written to the response per chunk
+
+# CSV headers in migrate_csv.py's layout, so an export can be re-imported as is
+EXPORT_CSV_HEADERS = ['Room Number', 'Full Name', 'Appointment Type', 'Start Date', 'End Date']
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def export_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields lists of office_assignments rows (ordered by id) from one read snapshot, on a connection of its own.
+
+    Runs while the response is being sent, after the request's connection has gone back to the pool.
+    """
+    conn = get_pool().acquire()
+    try:
+        conn.execute('BEGIN') # Every chunk comes from the same snapshot even if writes land mid-export
+        cur = conn.execute(f'SELECT {OCCUPANT_COLUMNS} FROM office_assignments ORDER BY id')
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        get_pool().release(conn) # Also rolls back the read transaction
+
+def export_csv():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_HEADERS)
+    for rows in export_rows():
+        writer.writerows((row['office_id'], row['full_name'], row['appointment_type'] or '',
+                          row['start_date'] or '', row['end_date'] or '') for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue() # Header only: the table is empty
+
+def export_ndjson():
+    for rows in export_rows():
+        # Same objects as assignments_dates.json, one per line
+        yield ''.join(json.dumps({"office_id": row['office_id'], "full_name": row['full_name'],
+                                  "appointment_type": row['appointment_type'], "start_date": row['start_date'],
+                                  "end_date": row['end_date'], "is_temporary": bool(row['is_temporary'])}) + '\n'
+                      for row in rows)
+
+
+@app.route('/api/export', methods=['GET'])
+def export_api():
+    """API endpoint streaming every assignment as CSV (default; re-importable by migrate_csv.py) or NDJSON.
+
+    Rows are read and sent EXPORT_CHUNK_SIZE at a time, so memory use doesn't grow with the table.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown format '{export_format}'. Valid formats: {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        get_db().execute('SELECT 1 FROM office_assignments LIMIT 1') # Fail fast with a JSON error rather than a broken download
+    except sqlite3.OperationalError as e:
+         if "no such table" in str(e):
+              return jsonify({"error": "Database not initialized. Run 'flask init-db' and migration script."}), 500
+         app.logger.error(f"Database error starting export: {e}")
+         return jsonify({"error": "Database error", "details": str(e)}), 500
+
+    generator = export_csv() if export_format == 'csv' else export_ndjson()
+    response = Response(generator, mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="office_assignments-{date.today().isoformat()}.{export_format}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --- Occupant Write Helpers ---
+# Shared by the single-occupant routes and /api/batch. Each runs inside the caller's transaction,
+# logs the change, and returns (change entry, row) -- or None if the occupant doesn't exist.
+# Callers commit and then publish_change() the entries.
+#
+# Every write is one statement that changes the row and returns it (RETURNING). Updates, moves and
+# deletes can be made conditional on the row's version (from If-Match); if it has moved on they
+# raise VersionConflict instead of overwriting someone else's edit.
+
+class VersionConflict(Exception):
+    """A conditional write found the occupant at a different version. 'current' is the row as it is now."""
+
+    def __init__(self, current):
+        super().__init__(f"Occupant {current['id']} is at version {current['version']}")
+        self.current = current
+
+def fetch_occupant(db, occupant_id):
+    """Returns the office_assignments row for an occupant, or None."""
+    return db.execute(f'SELECT {OCCUPANT_COLUMNS} FROM office_assignments WHERE id = ?', [occupant_id]).fetchone()
+
+def version_condition(expected_version):
+    """WHERE-clause suffix and parameters limiting a write to the expected row version (none if None)."""
+    return (' AND version = ?', [expected_version]) if expected_version is not None else ('', [])
+
+def missing_or_conflict(db, occupant_id, expected_version):
+    """Called when a write matched no row: returns None if the occupant doesn't exist, raises VersionConflict if it does."""
+    current = fetch_occupant(db, occupant_id) if expected_version is not None else None
+    if current is not None:
+        raise VersionConflict(current)
+    return None
+
+def occupant_response(row):
+    """Occupant as returned by the mutation routes: the row plus 'temporary', with 'id' renamed."""
+    occupant = dict(row)
+    occupant['temporary'] = bool(row['is_temporary'])
+    occupant['occupant_id'] = occupant.pop('id') # Rename id key
+    return occupant
+
+def add_fields_from_json(data):
+    """Validates an add-occupant payload. Returns (fields, error message)."""
     full_name = data.get('name')
     appointment_type = data.get('appointment_type', None) # Optional for now
-    start_date = data.get('startDate') # Expecting<x_bin_398>-MM-DD or empty/null
-    end_date = data.get('endDate')     # Expecting<x_bin_398>-MM-DD or empty/null
+    start_date = data.get('startDate') # Expecting YYYY-MM-DD or empty/null
+    end_date = data.get('endDate')     # Expecting YYYY-MM-DD or empty/null
     is_temporary = data.get('temporary', False)
 
     if not full_name:
-        return jsonify({"error": "Missing 'name' field"}), 400
-    if not office_id:
-        return jsonify({"error": "Missing 'office_id' in URL"}), 400 # Should be caught by Flask routing
+        return None, "Missing 'name' field"
 
     # Ensure dates are null if empty strings
     start_date = start_date if start_date else None
@@ -195,48 +1667,11 @@ def add_occupant_api(office_id):
         start_date = None
         end_date = None
 
-    db = get_db()
-    try:
-        cursor = db.execute('''
-            INSERT INTO office_assignments
-            (office_id, full_name, appointment_type, start_date, end_date, is_temporary)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', [office_id, full_name, appointment_type, start_date, end_date, is_temporary])
-        db.commit()
-        new_occupant_id = cursor.lastrowid
-
-        # Fetch the newly created occupant to return it
-        cur = db.execute('''
-            SELECT id, office_id, full_name, appointment_type, start_date, end_date, is_temporary
-            FROM office_assignments WHERE id = ?
-            ''', [new_occupant_id])
-        new_occupant_row = cur.fetchone()
-        if new_occupant_row:
-            new_occupant = dict(new_occupant_row)
-            new_occupant['temporary'] = bool(new_occupant_row['is_temporary'])
-            new_occupant['occupant_id'] = new_occupant.pop('id') # Rename id key
-            return jsonify({"message": "Occupant added successfully", "occupant": new_occupant}), 201 # 201 Created status
-        else:
-             # Should not happen if insert succeeded, but handle defensively
-             return jsonify({"message": "Occupant added, but could not retrieve details."}), 200
-
-    except sqlite3.Error as e:
-        db.rollback()
-        app.logger.error(f"Database error adding occupant: {e}")
-        return jsonify({"error": "Database error", "details": str(e)}), 500
-    except Exception as e:
-        db.rollback()
-        app.logger.error(f"Unexpected error adding occupant: {e}")
-        return jsonify({"error": "An unexpected error occurred"}), 500
-
+    return {"full_name": full_name, "appointment_type": appointment_type, "start_date": start_date,
+            "end_date": end_date, "is_temporary": is_temporary}, None
 
-@app.route('/api/occupants/<int:occupant_id>', methods=['PUT'])
-def update_occupant_api(occupant_id):
-    """API endpoint to update an existing occupant's details."""
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
-
-    data = request.get_json()
+def update_fields_from_json(data):
+    """Validates an update-occupant payload. Returns (fields, error message)."""
     full_name = data.get('name')
     # You could add appointment_type update here if needed
     start_date = data.get('startDate')
@@ -244,7 +1679,7 @@ def update_occupant_api(occupant_id):
     is_temporary = data.get('temporary', None) # Use None to detect if it was sent
 
     if not full_name:
-        return jsonify({"error": "Missing 'name' field"}), 400
+        return None, "Missing 'name' field"
 
     # Ensure dates are null if empty strings
     start_date = start_date if start_date else None
@@ -261,40 +1696,150 @@ def update_occupant_api(occupant_id):
         start_date = None
         end_date = None
 
+    return {"full_name": full_name, "start_date": start_date, "end_date": end_date,
+            "is_temporary": final_temporary}, None
+
+def insert_occupant(db, office_id, fields):
+    """Inserts a new occupant into an office."""
+    row = db.execute(f'''
+        INSERT INTO office_assignments
+        (office_id, full_name, appointment_type, start_date, end_date, is_temporary)
+        VALUES (?, ?, ?, ?, ?, ?)
+        RETURNING {OCCUPANT_COLUMNS}
+    ''', [office_id, fields['full_name'], fields['appointment_type'], fields['start_date'],
+          fields['end_date'], fields['is_temporary']]).fetchall()[0]
+    version = record_change(db, 'insert', row['id'], office_id)
+    return change_entry('insert', version, row['id'], office_id, occupant_to_dict(row)), row
+
+def update_occupant(db, occupant_id, fields, expected_version=None):
+    """Updates an occupant's name, dates and temporary flag."""
+    condition, condition_params = version_condition(expected_version)
+    rows = db.execute(f'''
+        UPDATE office_assignments
+        SET full_name = ?, start_date = ?, end_date = ?, is_temporary = ?, version = version + 1
+        WHERE id = ?{condition}
+        RETURNING {OCCUPANT_COLUMNS}
+    ''', [fields['full_name'], fields['start_date'], fields['end_date'], fields['is_temporary'], occupant_id] + condition_params).fetchall()
+    if not rows:
+        return missing_or_conflict(db, occupant_id, expected_version)
+    row = rows[0]
+    version = record_change(db, 'update', occupant_id, row['office_id'])
+    return change_entry('update', version, occupant_id, row['office_id'], occupant_to_dict(row)), row
+
+def move_occupant(db, occupant_id, office_id, expected_version=None):
+    """Moves an occupant to another office."""
+    condition, condition_params = version_condition(expected_version)
+    rows = db.execute(f'''
+        UPDATE office_assignments SET office_id = ?, version = version + 1
+        WHERE id = ?{condition}
+        RETURNING {OCCUPANT_COLUMNS}
+    ''', [office_id, occupant_id] + condition_params).fetchall()
+    if not rows:
+        return missing_or_conflict(db, occupant_id, expected_version)
+    row = rows[0]
+    version = record_change(db, 'update', occupant_id, office_id)
+    return change_entry('update', version, occupant_id, office_id, occupant_to_dict(row)), row
+
+def delete_occupant(db, occupant_id, expected_version=None):
+    """Removes an occupant. The returned row is the occupant as it was before deletion."""
+    condition, condition_params = version_condition(expected_version)
+    rows = db.execute(f'''
+        DELETE FROM office_assignments WHERE id = ?{condition}
+        RETURNING {OCCUPANT_COLUMNS}
+    ''', [occupant_id] + condition_params).fetchall()
+    if not rows:
+        return missing_or_conflict(db, occupant_id, expected_version)
+    existing = rows[0]
+    version = record_change(db, 'delete', occupant_id, existing['office_id'])
+    return change_entry('delete', version, occupant_id, existing['office_id']), existing
+
+def if_match_version():
+    """The occupant version a write is conditional on, from If-Match. Returns (version or None, error message).
+
+    No header (or 'If-Match: *') means unconditional; otherwise it must be the one ETag the API sent, e.g. "3".
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None, None
+    tags = request.if_match.as_set()
+    if len(tags) != 1 or not next(iter(tags)).isdigit():
+        return None, 'If-Match must be a single occupant version ETag, e.g. "3"'
+    return int(next(iter(tags))), None
+
+def version_conflict_response(conflict):
+    """412 with the occupant as it is now, so the client can show what changed and retry against its version."""
+    response = jsonify({"error": "Occupant was changed by someone else; reload it and retry",
+                        "occupant": occupant_response(conflict.current)})
+    response.status_code = 412
+    response.set_etag(str(conflict.current['version']))
+    return response
+
+
+@app.route('/api/offices/<string:office_id>/occupants', methods=['POST'])
+def add_occupant_api(office_id):
+    """API endpoint to add a new occupant to a specific office."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    fields, error = add_fields_from_json(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+    if not office_id:
+        return jsonify({"error": "Missing 'office_id' in URL"}), 400 # Should be caught by Flask routing
+
     db = get_db()
     try:
-        # First check if occupant exists
-        cur_check = db.execute('SELECT id FROM office_assignments WHERE id = ?', [occupant_id])
-        if not cur_check.fetchone():
-             return jsonify({"error": "Occupant not found"}), 404
+        begin_write(db)
+        entry, new_occupant_row = insert_occupant(db, office_id, fields)
+        db.commit()
+        publish_change(entry)
+        response = jsonify({"message": "Occupant added successfully", "occupant": occupant_response(new_occupant_row)})
+        response.set_etag(str(new_occupant_row['version']))
+        return response, 201 # 201 Created status
 
-        cursor = db.execute('''
-            UPDATE office_assignments
-            SET full_name = ?, start_date = ?, end_date = ?, is_temporary = ?
-            WHERE id = ?
-        ''', [full_name, start_date, end_date, final_temporary, occupant_id])
+    except sqlite3.Error as e:
+        db.rollback()
+        app.logger.error(f"Database error adding occupant: {e}")
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Unexpected error adding occupant: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
 
-        if cursor.rowcount == 0:
-            # This case should be caught by the check above, but handle just in case
-            return jsonify({"error": "Occupant not found or no change detected"}), 404
 
-        db.commit()
+@app.route('/api/occupants/<int:occupant_id>', methods=['PUT'])
+def update_occupant_api(occupant_id):
+    """API endpoint to update an existing occupant's details.
 
-        # Fetch the updated occupant to return it
-        cur = db.execute('''
-             SELECT id, office_id, full_name, appointment_type, start_date, end_date, is_temporary
-             FROM office_assignments WHERE id = ?
-             ''', [occupant_id])
-        updated_occupant_row = cur.fetchone()
-        if updated_occupant_row:
-            updated_occupant = dict(updated_occupant_row)
-            updated_occupant['temporary'] = bool(updated_occupant_row['is_temporary'])
-            updated_occupant['occupant_id'] = updated_occupant.pop('id') # Rename id key
-            return jsonify({"message": "Occupant updated successfully", "occupant": updated_occupant}), 200
-        else:
-             return jsonify({"error": "Update successful but failed to retrieve updated record"}), 500
+    With If-Match: "<version>" (the ETag of the occupant's last response, or its 'version' field) the update
+    only applies if nobody changed the occupant since; otherwise it fails with 412 and the current occupant.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
 
+    fields, error = update_fields_from_json(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+    expected_version, error = if_match_version()
+    if error:
+        return jsonify({"error": error}), 400
+
+    db = get_db()
+    try:
+        begin_write(db)
+        outcome = update_occupant(db, occupant_id, fields, expected_version)
+        if outcome is None:
+             return jsonify({"error": "Occupant not found"}), 404
 
+        entry, updated_occupant_row = outcome
+        db.commit()
+        publish_change(entry)
+        response = jsonify({"message": "Occupant updated successfully", "occupant": occupant_response(updated_occupant_row)})
+        response.set_etag(str(updated_occupant_row['version']))
+        return response, 200
+
+    except VersionConflict as conflict:
+        db.rollback()
+        return version_conflict_response(conflict)
     except sqlite3.Error as e:
         db.rollback()
         app.logger.error(f"Database error updating occupant {occupant_id}: {e}")
@@ -307,23 +1852,26 @@ def update_occupant_api(occupant_id):
 
 @app.route('/api/occupants/<int:occupant_id>', methods=['DELETE'])
 def delete_occupant_api(occupant_id):
-    """API endpoint to delete an occupant."""
+    """API endpoint to delete an occupant. Honors If-Match like the update route (412 if the occupant changed)."""
+    expected_version, error = if_match_version()
+    if error:
+        return jsonify({"error": error}), 400
+
     db = get_db()
     try:
-        # First check if occupant exists
-        cur_check = db.execute('SELECT id FROM office_assignments WHERE id = ?', [occupant_id])
-        if not cur_check.fetchone():
-             return jsonify({"error": "Occupant not found"}), 404
-
-        cursor = db.execute('DELETE FROM office_assignments WHERE id = ?', [occupant_id])
-
-        if cursor.rowcount == 0:
-             # Should be caught by check above
+        begin_write(db)
+        outcome = delete_occupant(db, occupant_id, expected_version)
+        if outcome is None:
              return jsonify({"error": "Occupant not found"}), 404
 
+        entry, _ = outcome
         db.commit()
+        publish_change(entry)
         return jsonify({"message": "Occupant deleted successfully"}), 200
 
+    except VersionConflict as conflict:
+        db.rollback()
+        return version_conflict_response(conflict)
     except sqlite3.Error as e:
         db.rollback()
         app.logger.error(f"Database error deleting occupant {occupant_id}: {e}")
@@ -334,6 +1882,213 @@ def delete_occupant_api(occupant_id):
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 
+MAX_BATCH_OPERATIONS = 500 # Upper bound on operations per /api/batch request
+
+@app.route('/api/batch', methods=['POST'])
+def batch_api():
+    """API endpoint applying a list of add/update/delete/move operations in one transaction.
+
+    Body: {"atomic": true, "operations": [{"op": "add", "office_id": "431", "name": ...},
+    {"op": "update", "occupant_id": 7, "name": ...}, {"op": "move", "occupant_id": 7, "office_id": "432"},
+    {"op": "delete", "occupant_id": 7}]}. Add/update operations take the same fields as the single routes.
+    Update/move/delete accept "version" to apply only if the occupant is still at that version (else status 412).
+    With "atomic" (the default) the first failing operation rolls back the whole batch; otherwise each
+    operation runs in its own savepoint and the ones that succeed are committed together.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "Missing 'operations' list"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"Too many operations (max {MAX_BATCH_OPERATIONS})"}), 400
+    atomic = bool(data.get('atomic', True))
+
+    db = get_db()
+    results, entries = [], []
+    try:
+        begin_write(db) # Take the write lock once for the whole batch
+        for index, operation in enumerate(operations):
+            db.execute('SAVEPOINT batch_op')
+            try:
+                result, op_entries = apply_batch_operation(db, operation)
+            except sqlite3.IntegrityError as e:
+                result, op_entries = {"status": 400, "error": "Constraint violation", "details": str(e)}, []
+            result["index"] = index
+            results.append(result)
+
+            if result["status"] >= 400:
+                db.execute('ROLLBACK TO batch_op')
+                db.execute('RELEASE batch_op')
+                if atomic:
+                    db.rollback()
+                    return jsonify({"committed": False, "failed_index": index, "results": results}), result["status"]
+            else:
+                db.execute('RELEASE batch_op')
+                entries.extend(op_entries)
+
+        db.commit() # One commit (and one fsync) for the whole batch
+
+    except sqlite3.Error as e:
+        db.rollback()
+        app.logger.error(f"Database error applying batch: {e}")
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Unexpected error applying batch: {e}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+    for entry in entries:
+        publish_change(entry)
+    return jsonify({"committed": True, "results": results}), 200
+
+
+def apply_batch_operation(db, operation):
+    """Applies one /api/batch operation. Returns (result dict with HTTP-style status, change entries)."""
+    if not isinstance(operation, dict):
+        return {"status": 400, "error": "Operation must be an object"}, []
+    op = operation.get('op')
+
+    if op == 'add':
+        office_id = operation.get('office_id')
+        if not office_id:
+            return {"status": 400, "error": "Missing 'office_id' field"}, []
+        fields, error = add_fields_from_json(operation)
+        if error:
+            return {"status": 400, "error": error}, []
+        entry, row = insert_occupant(db, str(office_id), fields)
+        return {"status": 201, "op": op, "occupant": occupant_response(row)}, [entry]
+
+    if op not in ('update', 'move', 'delete'):
+        return {"status": 400, "error": f"Unknown op '{op}'"}, []
+    occupant_id = operation.get('occupant_id')
+    if not isinstance(occupant_id, int) or isinstance(occupant_id, bool):
+        return {"status": 400, "error": "Missing 'occupant_id' field"}, []
+    expected_version = operation.get('version')
+    if expected_version is not None and (not isinstance(expected_version, int) or isinstance(expected_version, bool)):
+        return {"status": 400, "error": "'version' must be an integer"}, []
+
+    try:
+        if op == 'update':
+            fields, error = update_fields_from_json(operation)
+            if error:
+                return {"status": 400, "error": error}, []
+            outcome = update_occupant(db, occupant_id, fields, expected_version)
+        elif op == 'move':
+            office_id = operation.get('office_id')
+            if not office_id:
+                return {"status": 400, "error": "Missing 'office_id' field"}, []
+            outcome = move_occupant(db, occupant_id, str(office_id), expected_version)
+        else:
+            outcome = delete_occupant(db, occupant_id, expected_version)
+    except VersionConflict as conflict:
+        return {"status": 412, "op": op, "error": "Occupant was changed by someone else",
+                "occupant": occupant_response(conflict.current)}, []
+
+    if outcome is None:
+        return {"status": 404, "op": op, "error": "Occupant not found"}, []
+    entry, row = outcome
+    result = {"status": 200, "op": op, "occupant_id": occupant_id}
+    if op != 'delete':
+        result["occupant"] = occupant_response(row)
+    return result, [entry]
+
+
+# --- Expiry of Temporary Occupants ---
+EXPIRY_BATCH_SIZE = 100  # Occupants archived per write transaction, so the write lock is held only briefly
+EXPIRY_MAX_SLEEP = 3600  # Loop mode re-checks at least this often (seconds) to pick up newly added end dates
+
+def expire_occupants(db, today, batch_size=EXPIRY_BATCH_SIZE):
+    """Moves temporary occupants whose end_date is before 'today' into office_assignments_archive.
+
+    Works through them 'batch_size' at a time, one transaction per batch, bumping the data version for
+    each removal like a DELETE through the API. Uses idx_assignments_end_start, never a full scan.
+    Returns how many were archived.
+    """
+    archived = 0
+    while True:
+        begin_write(db)
+        try:
+            ids = [row[0] for row in db.execute('''
+                SELECT id FROM office_assignments
+                WHERE end_date < ? AND is_temporary
+                ORDER BY end_date, id LIMIT ?
+                ''', [today.isoformat(), batch_size]).fetchall()]
+            entries = []
+            for occupant_id in ids:
+                db.execute('''
+                    INSERT OR REPLACE INTO office_assignments_archive
+                    (id, office_id, full_name, appointment_type, start_date, end_date, is_temporary, timestamp)
+                    SELECT id, office_id, full_name, appointment_type, start_date, end_date, is_temporary, timestamp
+                    FROM office_assignments WHERE id = ?
+                    ''', [occupant_id])
+                entry, _ = delete_occupant(db, occupant_id)
+                entries.append(entry)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        for entry in entries:
+            publish_change(entry)
+        archived += len(ids)
+        if len(ids) < batch_size:
+            return archived
+
+
+class ExpiryScheduler:
+    """Tracks the next temporary end date, used by loop mode to sleep until the next expiry."""
+
+    def __init__(self):
+        self.next_end_date = None
+
+    def refresh(self, db, today):
+        """Reads the earliest end date on or after 'today' (stops at the first match on idx_assignments_end_start)."""
+        row = db.execute('''
+            SELECT MIN(end_date) FROM office_assignments
+            WHERE end_date >= ? AND is_temporary
+            ''', [today.isoformat()]).fetchone()
+        self.next_end_date = parse_iso_date(row[0]) if row[0] is not None else None
+
+    def seconds_until_next(self, now, max_sleep):
+        """Seconds until the next assignment expires (midnight after its end date), capped at max_sleep."""
+        if self.next_end_date is None:
+            return max_sleep
+        expires_at = datetime.combine(self.next_end_date + timedelta(days=1), datetime.min.time())
+        return min(max_sleep, max(1.0, (expires_at - now).total_seconds()))
+
+
+@app.cli.command('expire-occupants')
+@click.option('--loop', is_flag=True, help="Keep running, waking up whenever the next assignment expires.")
+@click.option('--batch-size', default=EXPIRY_BATCH_SIZE, show_default=True, help="Occupants archived per transaction.")
+@click.option('--max-sleep', default=EXPIRY_MAX_SLEEP, show_default=True, help="Longest wait between checks in loop mode (seconds).")
+def expire_occupants_command(loop, batch_size, max_sleep):
+    """Archive temporary occupants whose end date has passed."""
+    scheduler = ExpiryScheduler()
+    try:
+        while True:
+            today = date.today()
+            db = get_pool().acquire()
+            try:
+                ensure_support_schema(db)
+                # The sweep is an index range scan that finds nothing when nothing is due, so every wake-up runs it
+                # (that also catches occupants added with an end date already in the past)
+                archived = expire_occupants(db, today, batch_size)
+                if archived or not loop:
+                    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} Archived {archived} expired occupant(s).")
+                if archived:
+                    checkpoint_history(db)
+                scheduler.refresh(db, today)
+            finally:
+                get_pool().release(db)
+            if not loop:
+                return
+            time.sleep(scheduler.seconds_until_next(datetime.now(), max_sleep))
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+
 # --- Run the App ---
 if __name__ == '__main__':
     # Create static directory if it doesn't exist (though now serving from root)
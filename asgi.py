@@ -0,0 +1,276 @@
+# office-space/asgi.py
+"""ASGI entry point serving app.py's routes without one thread per connected client.
+
+    pip install uvicorn
+    uvicorn asgi:application --host 0.0.0.0 --port 4999
+
+Ordinary requests run the Flask app on a bounded thread pool: at most WORKER_THREADS execute at once,
+at most MAX_QUEUED_REQUESTS wait for a thread, and anything beyond that gets a 503 straight away.
+/api/stream is served on the event loop itself, so each idle dashboard costs a coroutine and a small
+queue rather than a blocked worker. On shutdown, streams are closed (browsers reconnect after the
+'retry' delay), in-flight requests get SHUTDOWN_GRACE_SECONDS to finish, and pooled connections are closed.
+"""
+import asyncio
+import concurrent.futures
+import io
+import json
+import sys
+import time
+
+import app as flask_module
+import change_stream
+
+# --- Configuration ---
+WORKER_THREADS = 16            # Flask requests executing at once (each holds a pooled SQLite connection)
+MAX_QUEUED_REQUESTS = 256      # Requests allowed to wait for a worker before new ones are turned away with 503
+MAX_STREAMS = 10000            # Concurrent /api/stream connections
+MAX_BODY_BYTES = 10 * 1024 * 1024
+SHUTDOWN_GRACE_SECONDS = 10.0  # How long shutdown waits for in-flight requests
+VERSION_CACHE_SECONDS = 1.0    # Idle streams share one data-version read per interval instead of one each
+
+STREAM_PATH = '/api/stream'
+
+
+class OfficeSpaceASGI:
+    """ASGI application wrapping the Flask app (WSGI) with a bounded thread-pool offload."""
+
+    def __init__(self, wsgi_app, broadcaster, read_data_version, close_pool):
+        self.wsgi_app = wsgi_app
+        self.broadcaster = broadcaster
+        self.read_data_version = read_data_version
+        self.close_pool = close_pool
+        self.executor = None
+        self.slots = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.streams = set()
+        self.closing = False
+        self._version = None # (read at, (epoch, version))
+        self._version_future = None
+
+    # --- Lifecycle ---
+    def _start(self):
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(WORKER_THREADS, thread_name_prefix='office-space')
+            self.slots = asyncio.Semaphore(WORKER_THREADS)
+
+    async def _shutdown(self):
+        self.closing = True
+        for task in list(self.streams):
+            task.cancel()
+        deadline = time.monotonic() + SHUTDOWN_GRACE_SECONDS
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.close_pool()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return # No websockets
+        self._start() # Servers without lifespan support
+        if self.closing:
+            return await send_json(send, 503, {"error": "Server is shutting down"})
+        if scope['path'] == STREAM_PATH and scope['method'] == 'GET':
+            return await self._serve_stream(receive, send)
+        return await self._serve_wsgi(scope, receive, send)
+
+    async def _offload(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # --- Flask requests on the thread pool ---
+    async def _serve_wsgi(self, scope, receive, send):
+        if self.waiting >= MAX_QUEUED_REQUESTS:
+            return await send_json(send, 503, {"error": "Server busy, try again shortly"}, [(b'retry-after', b'1')])
+        body = await read_body(receive)
+        if body is None:
+            return await send_json(send, 413, {"error": "Request body too large"})
+
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        chunks = None
+        try:
+            status, headers, chunks, chunk = await self._offload(call_wsgi, self.wsgi_app, build_environ(scope, body))
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            # Pull the body chunk by chunk on the pool so streamed responses (/api/export) stay streamed
+            while True:
+                following = await self._offload(next_chunk, chunks) if chunk is not None else None
+                await send({'type': 'http.response.body', 'body': chunk or b'', 'more_body': following is not None})
+                if following is None:
+                    break
+                chunk = following
+        finally:
+            if chunks is not None and hasattr(chunks, 'close'):
+                await self._offload(chunks.close) # Releases anything the response holds (e.g. an export's connection)
+            self.in_flight -= 1
+            self.slots.release()
+
+    # --- /api/stream on the event loop ---
+    async def _shared_data_version(self):
+        """Current (epoch, version), read at most once per VERSION_CACHE_SECONDS however many streams ask."""
+        now = time.monotonic()
+        if self._version is not None and now - self._version[0] < VERSION_CACHE_SECONDS:
+            return self._version[1]
+        if self._version_future is None:
+            self._version_future = asyncio.ensure_future(self._offload(self.read_data_version))
+            self._version_future.add_done_callback(self._version_read)
+        # Shielded: one stream disconnecting mustn't cancel the read the others are waiting for
+        return await asyncio.shield(self._version_future)
+
+    def _version_read(self, future):
+        self._version_future = None
+        if not future.cancelled() and future.exception() is None:
+            self._version = (time.monotonic(), future.result())
+
+    async def _serve_stream(self, receive, send):
+        if len(self.streams) >= MAX_STREAMS:
+            return await send_json(send, 503, {"error": "Too many open streams"}, [(b'retry-after', b'5')])
+        try:
+            await self._shared_data_version() # Fail fast with a JSON error rather than a broken stream
+        except Exception as e:
+            return await send_json(send, 500, {"error": "Database error", "details": str(e)})
+
+        task = asyncio.current_task()
+        self.streams.add(task)
+        watcher = asyncio.ensure_future(wait_for_disconnect(receive, task))
+        sub = change_stream.AsyncSubscription(asyncio.get_running_loop())
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            async for message in change_stream.stream_events_async(self.broadcaster, sub, self._shared_data_version):
+                await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+        except (asyncio.CancelledError, OSError):
+            pass # Client went away or the server is shutting down
+        finally:
+            watcher.cancel()
+            self.streams.discard(task)
+        try:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except Exception:
+            pass # Connection already gone
+
+
+# --- ASGI/WSGI plumbing ---
+async def read_body(receive):
+    """Reads the whole request body. Returns None if it exceeds MAX_BODY_BYTES."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return bytes(body)
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            return None
+        if not message.get('more_body', False):
+            return bytes(body)
+
+
+async def wait_for_disconnect(receive, task):
+    """Cancels 'task' when the client disconnects."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            task.cancel()
+            return
+
+
+async def send_json(send, status, payload, extra_headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] + list(extra_headers)})
+    await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope (PEP 3333 strings: latin-1 decoded bytes)."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue # Set from the body actually received
+        key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Runs the WSGI app (on a pool thread). Returns (status, ASGI headers, body iterator, first non-empty chunk or None)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return lambda data: None # The legacy write() callable isn't used by Flask
+
+    result = wsgi_app(environ, start_response)
+    chunks = iter(result)
+    first = next_chunk(chunks)
+    if hasattr(result, 'close') and not hasattr(chunks, 'close'):
+        chunks = ClosingIterator(chunks, result.close)
+    return started['status'], started['headers'], chunks, first
+
+
+def next_chunk(chunks):
+    """Next non-empty body chunk, or None at the end."""
+    return next((chunk for chunk in chunks if chunk), None)
+
+
+class ClosingIterator:
+    """Iterator that forwards close() to the WSGI result it came from."""
+
+    def __init__(self, iterator, close):
+        self._iterator = iterator
+        self.close = close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+
+application = OfficeSpaceASGI(flask_module.app, flask_module.change_broadcaster,
+                              flask_module.read_data_version, lambda: flask_module.get_pool().close_all())
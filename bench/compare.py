@@ -0,0 +1,75 @@
+# office-space/bench/compare.py
+"""Compares two run_bench.py result files and fails on regressions.
+
+    python bench/compare.py baseline.json candidate.json [--threshold 10]
+
+Exits with status 1 if any shared metric got worse by more than the threshold (percent).
+"""
+import argparse
+import json
+import sys
+
+# Metric key -> True if higher is better
+COMPARED_KEYS = {
+    'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'seconds': False,
+    'rps': True, 'rows_per_second': True,
+}
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, candidate, threshold):
+    """Yields (size, metric, key, old, new, percent change, regressed) for every metric both runs have."""
+    for size, old_metrics in baseline["results"].items():
+        new_metrics = candidate["results"].get(size)
+        if new_metrics is None:
+            continue
+        for name, old in old_metrics.items():
+            new = new_metrics.get(name)
+            if name == 'peak_rss_mb' and new is not None:
+                old, new = {'peak_rss_mb': old}, {'peak_rss_mb': new}
+                keys = {'peak_rss_mb': False}
+            elif isinstance(old, dict) and isinstance(new, dict):
+                keys = COMPARED_KEYS
+            else:
+                continue
+            for key, higher_is_better in keys.items():
+                if old.get(key) is None or new.get(key) is None or old[key] == 0:
+                    continue
+                change = (new[key] - old[key]) / old[key] * 100
+                worse = -change if higher_is_better else change
+                yield size, name, key, old[key], new[key], change, worse > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent worsening that counts as a regression")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"Baseline:  {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    print(f"Candidate: {candidate['meta'].get('commit')} ({candidate['meta'].get('timestamp')})")
+
+    regressions = 0
+    current_size = None
+    for size, name, key, old, new, change, regressed in compare(baseline, candidate, args.threshold):
+        if size != current_size:
+            print(f"\n== {size} occupants ==")
+            current_size = size
+        flag = "  REGRESSION" if regressed else ""
+        print(f"  {name:<18} {key:<16} {old:>12.3f} -> {new:>12.3f}  {change:>+7.1f}%{flag}")
+        regressions += regressed
+
+    if regressions:
+        print(f"\n{regressions} metric(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+    print(f"\nNo regressions above {args.threshold}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# office-space/bench/generate_data.py
+"""Generates synthetic office assignment CSVs in the assignments_dates.csv column layout."""
+import argparse
+import csv
+import random
+from datetime import date, timedelta
+
+HEADERS = ['Room Number', 'Full Name', 'Appointment Type', 'Start Date', 'End Date']
+
+# Weighted like the real export: mostly faculty and students, a tail of visitors and staff
+APPOINTMENT_TYPES = [
+    ('Faculty', 30), ('Graduate Student', 28), ('Postdoctoral Scholar', 10), ('Research Scientist', 10),
+    ('Faculty in Physics', 10), ('Technical Staff', 9), ('Administrative Staff', 7), ('Visiting Faculty', 5),
+    ('Visiting Researcher', 2), ('Visiting Student', 2), ('Project Scientist', 2),
+]
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+               'Karin', 'Dusan', 'David', 'Matt', 'Stella', 'Cameron', 'Leah', 'Sean', 'Will', 'Yue']
+LAST_NAMES = ['Nguyen', 'Smith', 'Garcia', 'Chen', 'Kim', 'Patel', 'Lopez', 'Brown', 'Lee', 'Wilson',
+              'Sandstrom', 'Keres', 'Tytler', 'Chu', 'Zhang', 'Trapp', 'Valmidiano', 'Casey', 'Hicks', 'Lu']
+
+OCCUPANTS_PER_ROOM = 3 # Average; rooms get 1-5 people
+
+
+def room_ids(floors, rooms_per_floor):
+    """Room IDs per floor, e.g. {1: ['1001', '1002', ...], 2: [...]}."""
+    return {floor: [f"{floor}{index:03d}" for index in range(1, rooms_per_floor + 1)]
+            for floor in range(1, floors + 1)}
+
+
+def format_short_date(day):
+    """M/D/YY, the format HR exports use."""
+    return f"{day.month}/{day.day}/{day.year % 100:02d}"
+
+
+def generate_rows(occupants, floors, seed=0, today=None):
+    """Yields (room, name, appointment type, start, end) rows for 'occupants' people spread over 'floors' floors.
+
+    About a quarter of the people are temporary, with end dates from last year to two years out,
+    so date-range queries and expiry have realistic work to do.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    rooms_per_floor = max(1, occupants // (floors * OCCUPANTS_PER_ROOM))
+    all_rooms = [room for rooms in room_ids(floors, rooms_per_floor).values() for room in rooms]
+    types, weights = zip(*APPOINTMENT_TYPES)
+
+    for index in range(occupants):
+        room = all_rooms[index % len(all_rooms)] if index < len(all_rooms) else rng.choice(all_rooms)
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {index}" # Suffix keeps names unique for --sync matching
+        start = end = ''
+        if rng.random() < 0.25:
+            end_day = today + timedelta(days=rng.randint(-365, 730))
+            end = format_short_date(end_day)
+            if rng.random() < 0.5:
+                start = format_short_date(end_day - timedelta(days=rng.randint(30, 700)))
+        elif rng.random() < 0.1:
+            start = format_short_date(today - timedelta(days=rng.randint(0, 2000)))
+        yield (room, name, rng.choices(types, weights)[0], start, end)
+
+
+def write_csv(path, occupants, floors, seed=0):
+    """Writes a synthetic export to 'path'. Returns the rooms per floor it used."""
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADERS)
+        writer.writerows(generate_rows(occupants, floors, seed))
+    return room_ids(floors, max(1, occupants // (floors * OCCUPANTS_PER_ROOM)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic office assignments CSV.")
+    parser.add_argument('output', help="CSV file to write")
+    parser.add_argument('--occupants', type=int, default=1000)
+    parser.add_argument('--floors', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.output, args.occupants, args.floors, args.seed)
+    print(f"Wrote {args.occupants} occupants across {args.floors} floors to {args.output}")
@@ -0,0 +1,308 @@
+# office-space/bench/run_bench.py
+"""Benchmarks the Flask API and the CSV importer on synthetic datasets.
+
+Each dataset size runs in its own subprocess, in a temporary directory with its own database, so caches
+start cold and peak RSS is per size. Results are written as JSON for bench/compare.py.
+
+    python bench/run_bench.py                          # 1k, 10k and 100k occupants
+    python bench/run_bench.py --sizes 1000 --duration 2 --output /tmp/quick.json
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import generate_data
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+# --- Statistics ---
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, elapsed=None, errors=0):
+    """Latency summary in milliseconds; includes requests per second when the wall time is known."""
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else None,
+        "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 3) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+    }
+    if elapsed:
+        summary["rps"] = round(len(values) / elapsed, 1)
+    return summary
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# --- Dataset Setup ---
+def prepare_database(app_module, size, floors):
+    """Creates mydatabase.db in the current directory and registers the synthetic rooms. Returns (csv path, rooms)."""
+    csv_path = os.path.abspath('bench_assignments.csv')
+    rooms = generate_data.write_csv(csv_path, size, floors)
+    app_module.app.test_cli_runner().invoke(args=['init-db'])
+    conn = sqlite3.connect(app_module.DATABASE)
+    conn.executemany('INSERT OR IGNORE INTO rooms (office_id, floor, sort_order) VALUES (?, ?, ?)',
+                     [(room, floor, position) for floor, room_list in rooms.items() for position, room in enumerate(room_list)])
+    conn.commit()
+    conn.close()
+    return csv_path, rooms
+
+
+def bench_import(migrate_module, csv_path, size):
+    """Times a full append import and a no-op --sync of the same file."""
+    results = {}
+    for name, sync in (("import_append", False), ("import_sync_noop", True)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            migrate_module.migrate_data(csv_path, sync=sync)
+            seconds = time.perf_counter() - start
+        results[name] = {"seconds": round(seconds, 4), "rows_per_second": round(size / seconds, 1)}
+    return results
+
+
+# --- In-Process Benchmarks (Flask test client) ---
+def bench_test_client(app_module, rooms, iterations):
+    """Times the read and write routes through Flask's test client (no network, no server threads)."""
+    client = app_module.app.test_client()
+    results = {}
+
+    def measure(name, call, count, before=None):
+        latencies, errors = [], 0
+        for _ in range(count):
+            if before:
+                before()
+            start = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        results[name] = summarize(latencies, errors=errors)
+
+    probe = client.post('/api/offices/bench-probe/occupants', json={"name": "Bench Probe"}).get_json()
+    probe_id = probe["occupant"]["occupant_id"]
+    touch = lambda: client.put(f'/api/occupants/{probe_id}', json={"name": f"Bench Probe {random.random()}"})
+
+    # Cold: every GET follows a write, so the snapshot is rebuilt from the table each time
+    measure("offices_cold", lambda: client.get('/api/offices'), max(5, iterations // 10), before=touch)
+    measure("offices_warm", lambda: client.get('/api/offices'), iterations)
+    etag = client.get('/api/offices').headers.get('ETag')
+    measure("offices_304", lambda: client.get('/api/offices', headers={"If-None-Match": etag}), iterations)
+    first_floor = min(rooms)
+    measure("floor_offices", lambda: client.get(f'/api/floors/{first_floor}/offices'), iterations)
+    # Cold: a write between reads makes the per-process result cache miss every time
+    measure("floor_offices_cold", lambda: client.get(f'/api/floors/{first_floor}/offices'), max(5, iterations // 10), before=touch)
+    measure("office_single", lambda: client.get(f'/api/offices/{rooms[first_floor][0]}'), iterations)
+    version = int(client.get('/api/offices').headers.get('X-Data-Version', 0))
+    measure("search_name", lambda: client.get('/api/search?q=trapp 1234'), iterations)
+    measure("search_prefix", lambda: client.get('/api/search?q=ngu&limit=20'), iterations)
+    measure("export_csv", lambda: client.get('/api/export', buffered=True), max(5, iterations // 10))
+    measure("changes_last_10", lambda: client.get(f'/api/changes?since={max(0, version - 10)}'), iterations)
+
+    office = rooms[first_floor][0]
+    created = []
+    measure("add_occupant", lambda: created.append(client.post(f'/api/offices/{office}/occupants', json={"name": "Bench Add"})) or created[-1], iterations)
+    ids = [response.get_json()["occupant"]["occupant_id"] for response in created if response.status_code == 201]
+    id_iter = iter(ids)
+    measure("update_occupant", lambda: client.put(f'/api/occupants/{next(id_iter)}', json={"name": "Bench Update"}), len(ids))
+    id_iter = iter(ids)
+    measure("delete_occupant", lambda: client.delete(f'/api/occupants/{next(id_iter)}'), len(ids))
+
+    batch_results = []
+    add_ops = [{"op": "add", "office_id": office, "name": f"Bench Batch {i}"} for i in range(40)]
+    measure("batch_add_40", lambda: batch_results.append(client.post('/api/batch', json={"operations": add_ops})) or batch_results[-1],
+            max(5, iterations // 10))
+    for response in batch_results:
+        delete_ops = [{"op": "delete", "occupant_id": r["occupant"]["occupant_id"]} for r in response.get_json().get("results", [])]
+        client.post('/api/batch', json={"operations": delete_ops})
+    client.delete(f'/api/occupants/{probe_id}')
+    return results
+
+
+# --- HTTP Load Generation ---
+def bench_http(app_module, rooms, size, threads, duration):
+    """Serves the app on a local threaded server and drives it from 'threads' concurrent clients."""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # No per-request access log
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    port = server.server_port
+
+    def request(method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            response.read()
+            return response.status, response.getheader('ETag')
+        finally:
+            conn.close()
+
+    etag = request('GET', '/api/offices')[1]
+    floors = sorted(rooms)
+
+    def offices_only(rng):
+        return 'GET', '/api/offices', None, None
+
+    def mixed(rng):
+        roll = rng.random()
+        if roll < 0.7:
+            return 'GET', f'/api/floors/{rng.choice(floors)}/offices', None, None
+        if roll < 0.9:
+            return 'GET', '/api/offices', None, {"If-None-Match": etag}
+        body = json.dumps({"name": f"Load Test {rng.random()}"})
+        return 'PUT', f'/api/occupants/{rng.randint(1, size)}', body, {"Content-Type": "application/json"}
+
+    results = {}
+    for name, pick in (("http_offices", offices_only), ("http_mixed", mixed)):
+        latencies, errors = [], [0] * threads # One error count per worker, summed after join (+= isn't atomic)
+        deadline = time.perf_counter() + duration
+
+        def worker(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                method, path, body, headers = pick(rng)
+                start = time.perf_counter()
+                try:
+                    status, _ = request(method, path, body, headers)
+                    if status >= 400:
+                        errors[seed] += 1
+                except OSError:
+                    errors[seed] += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        results[name] = summarize(latencies, elapsed=time.perf_counter() - started, errors=sum(errors))
+
+    server.shutdown()
+    return results
+
+
+# --- Drivers ---
+def run_worker(args):
+    """Benchmarks one dataset size in a fresh temp directory and prints the results as JSON."""
+    with tempfile.TemporaryDirectory(prefix='office-space-bench-') as workdir:
+        os.chdir(workdir) # app.py and migrate_csv.py use a relative DATABASE path
+        import app as app_module
+        import migrate_csv
+
+        csv_path, rooms = prepare_database(app_module, args.size, args.floors)
+        results = bench_import(migrate_csv, csv_path, args.size)
+        results.update(bench_test_client(app_module, rooms, args.iterations))
+        if args.duration > 0:
+            results.update(bench_http(app_module, rooms, args.size, args.threads, args.duration))
+        results["peak_rss_mb"] = round(peak_rss_bytes() / (1024 * 1024), 1)
+        os.chdir(REPO_ROOT)
+    json.dump(results, sys.stdout)
+
+
+def git_revision():
+    """Current commit (with a '-dirty' suffix for uncommitted changes), or None outside a git checkout."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(results):
+    for size, metrics in results.items():
+        print(f"\n== {size} occupants (peak RSS {metrics.get('peak_rss_mb')} MB) ==")
+        for name, metric in metrics.items():
+            if not isinstance(metric, dict):
+                continue
+            if "seconds" in metric:
+                print(f"  {name:<18} {metric['seconds']:>9.3f} s   {metric['rows_per_second']:>10.0f} rows/s")
+            else:
+                rps = f"{metric['rps']:>8.1f} req/s" if "rps" in metric else ""
+                print(f"  {name:<18} p50 {metric['p50_ms']:>8.3f} ms  p95 {metric['p95_ms']:>8.3f} ms  p99 {metric['p99_ms']:>8.3f} ms  {rps}"
+                      + (f"  ({metric['errors']} errors)" if metric['errors'] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the office-space API and importer.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="comma-separated occupant counts")
+    parser.add_argument('--floors', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=200, help="requests per in-process measurement")
+    parser.add_argument('--threads', type=int, default=8, help="concurrent HTTP clients")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per HTTP scenario (0 to skip)")
+    parser.add_argument('--output', help="results file (default: bench/results/<timestamp>-<commit>.json)")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    revision = git_revision()
+    report = {
+        "meta": {
+            "commit": revision,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "floors": args.floors, "iterations": args.iterations, "threads": args.threads, "duration": args.duration,
+        },
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(',')):
+        print(f"Benchmarking {size} occupants...", file=sys.stderr)
+        worker = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', '--size', str(size),
+                                 '--floors', str(args.floors), '--iterations', str(args.iterations),
+                                 '--threads', str(args.threads), '--duration', str(args.duration)],
+                                capture_output=True, text=True)
+        if worker.returncode != 0:
+            print(worker.stderr, file=sys.stderr)
+            sys.exit(f"Benchmark for {size} occupants failed")
+        report["results"][str(size)] = json.loads(worker.stdout)
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f"{datetime.now():%Y%m%d-%H%M%S}-{revision or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_summary(report["results"])
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# office-space/change_stream.py
+"""In-process fan-out of occupant change events to Server-Sent Events subscribers."""
+import asyncio
+import collections
+import json
+import threading
+
+# --- Configuration ---
+SUBSCRIBER_QUEUE_SIZE = 100 # Events buffered per subscriber before it is told to resync instead
+KEEPALIVE_SECONDS = 15      # Idle interval between keepalive comments (also when cross-process writes are checked)
+
+
+class Subscription:
+    """Bounded event queue for one SSE client.
+
+    A client that falls more than SUBSCRIBER_QUEUE_SIZE events behind has its backlog dropped and is
+    flagged as overflowed; the stream then sends a single 'sync' event so the client catches up through
+    /api/changes. One stalled browser therefore costs at most one full queue of memory.
+    """
+
+    def __init__(self, max_size=SUBSCRIBER_QUEUE_SIZE):
+        self.max_size = max_size
+        self.events = collections.deque()
+        self.overflowed = False
+        self.cond = threading.Condition()
+
+    def put(self, event):
+        with self.cond:
+            if self.overflowed:
+                return # Already going to resync; later events are covered by it
+            if len(self.events) >= self.max_size:
+                self.events.clear()
+                self.overflowed = True
+            else:
+                self.events.append(event)
+            self.cond.notify()
+
+    def drain(self, timeout):
+        """Waits up to 'timeout' seconds and returns (events, overflowed), clearing both."""
+        with self.cond:
+            if not self.events and not self.overflowed:
+                self.cond.wait(timeout)
+            events = list(self.events)
+            overflowed = self.overflowed
+            self.events.clear()
+            self.overflowed = False
+            return events, overflowed
+
+
+class AsyncSubscription(Subscription):
+    """Subscription drained from an asyncio event loop (see asgi.py) instead of a blocked thread.
+
+    put() is still called from the threads that commit writes; it wakes the loop thread-safely.
+    """
+
+    def __init__(self, loop, max_size=SUBSCRIBER_QUEUE_SIZE):
+        super().__init__(max_size)
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+
+    def put(self, event):
+        super().put(event)
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def drain_async(self, timeout):
+        """Like drain(), without blocking the event loop."""
+        with self.cond:
+            pending = bool(self.events) or self.overflowed
+            if not pending:
+                self.wakeup.clear() # A put() after this schedules a fresh set()
+        if not pending:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        with self.cond:
+            events = list(self.events)
+            overflowed = self.overflowed
+            self.events.clear()
+            self.overflowed = False
+            return events, overflowed
+
+
+class ChangeBroadcaster:
+    """Publishes change events to every current Subscription."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, sub=None):
+        """Registers 'sub' (a new Subscription by default) and returns it."""
+        sub = sub if sub is not None else Subscription()
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.put(event)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event, data, event_id=None):
+    """Encodes one Server-Sent Events message."""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def opening_messages(key):
+    """First messages of a stream: the reconnect delay and a 'hello' announcing the (epoch, version) 'key'."""
+    return ["retry: 5000\n\n", format_sse('hello', {"epoch": key[0], "version": key[1]})]
+
+
+def change_messages(key, events):
+    """'change' messages for drained events newer than 'key'. Returns (messages, new key)."""
+    messages = []
+    for event in events:
+        if event['version'] <= key[1]:
+            continue # Already part of the version announced to the client
+        key = (key[0], event['version'])
+        messages.append(format_sse('change', event, event_id=event['version']))
+    return messages, key
+
+
+def idle_message(key, current, overflowed):
+    """After an idle wait or an overflow: 'sync' if the client must catch up, else a keepalive. Returns (message, new key)."""
+    # An older 'current' (a cached read, see asgi.py) isn't news: the client already has newer changes
+    if overflowed or current[0] != key[0] or current[1] > key[1]:
+        # Missed events (slow consumer or another process wrote): catch up via /api/changes
+        return format_sse('sync', {"epoch": current[0], "version": current[1]}), current
+    return ": keepalive\n\n", key
+
+
+def stream_events(broadcaster, read_data_version):
+    """Generator yielding SSE messages until the client disconnects.
+
+    'read_data_version' returns the current (epoch, version). The stream announces it in a 'hello'
+    event and polls it on idle ticks to notice writes made by other processes.
+    """
+    # Subscribe before reading the version so nothing committed in between is missed
+    sub = broadcaster.subscribe()
+    try:
+        key = read_data_version()
+        yield from opening_messages(key)
+        while True:
+            events, overflowed = sub.drain(KEEPALIVE_SECONDS)
+            messages, key = change_messages(key, events)
+            yield from messages
+            if overflowed or not events:
+                message, key = idle_message(key, read_data_version(), overflowed)
+                yield message
+    finally:
+        broadcaster.unsubscribe(sub)
+
+
+async def stream_events_async(broadcaster, sub, read_data_version):
+    """Async generator version of stream_events() for an already created AsyncSubscription.
+
+    'read_data_version' is a coroutine function returning (epoch, version).
+    """
+    broadcaster.subscribe(sub)
+    try:
+        key = await read_data_version()
+        for message in opening_messages(key):
+            yield message
+        while True:
+            events, overflowed = await sub.drain_async(KEEPALIVE_SECONDS)
+            messages, key = change_messages(key, events)
+            for message in messages:
+                yield message
+            if overflowed or not events:
+                message, key = idle_message(key, await read_data_version(), overflowed)
+                yield message
+    finally:
+        broadcaster.unsubscribe(sub)
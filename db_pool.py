@@ -0,0 +1,225 @@
+# office-space/db_pool.py
+"""SQLite connection pooling and tuning shared by app.py and migrate_csv.py."""
+import os
+import sqlite3
+import threading
+import time
+
+# --- Configuration ---
+# Defaults for every connection. app.py overrides them through app.config['SQLITE_SETTINGS'].
+DEFAULT_SETTINGS = {
+    'journal_mode': 'WAL',       # Readers and the writer don't block each other
+    'synchronous': 'NORMAL',     # Safe with WAL; fsync at checkpoints instead of every commit
+    'cache_size': -16000,        # Page cache per connection; negative means KiB (here ~16 MB)
+    'mmap_size': 64 * 1024 * 1024, # Bytes of the database file to memory-map for reads
+    'busy_timeout': 5.0,         # Seconds SQLite itself waits on a locked database
+    'lock_retries': 3,           # Extra attempts to take the write lock after busy_timeout expires
+    'lock_retry_delay': 0.1,     # Seconds before the first retry; doubles each attempt
+    'cached_statements': 256,    # Prepared statements kept per connection
+    'max_idle': 8,               # Warm connections kept in the pool between requests
+}
+
+
+def is_lock_error(error):
+    """True for the OperationalErrors SQLite raises when another connection holds the lock."""
+    message = str(error)
+    return isinstance(error, sqlite3.OperationalError) and ('database is locked' in message or 'database is busy' in message)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports execute/fetch time and row counts to its connection's query_observer, if one is set.
+
+    The observer is called as observer(sql, params, seconds, rows, queries, statement_seconds), where
+    'statement_seconds' is the statement's total so far once it has finished (None while rows remain).
+    """
+    _sql = None
+    _params = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        observer = self.connection.query_observer
+        if observer is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._sql, self._params, self._elapsed = sql, parameters, time.perf_counter() - start
+        # Statements without result columns (writes, PRAGMA x = y) are done once executed
+        observer(sql, parameters, self._elapsed, 0, 1, self._elapsed if self.description is None else None)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        observer = self.connection.query_observer
+        if observer is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        elapsed = time.perf_counter() - start
+        observer(sql, seq_of_parameters, elapsed, 0, 1, elapsed)
+        return self
+
+    def _fetched(self, start, rows, finished):
+        elapsed = time.perf_counter() - start
+        self._elapsed += elapsed
+        self.connection.query_observer(self._sql, self._params, elapsed, rows, 0, self._elapsed if finished else None)
+
+    def fetchone(self):
+        if self.connection.query_observer is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1, True) # Usually a single-row lookup
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self.connection.query_observer is None:
+            return super().fetchmany(size)
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        if self.connection.query_observer is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection that remembers which database file (device, inode) it was opened on.
+
+    Its cursors are TimedCursors; set 'query_observer' to collect per-statement timings.
+    """
+    file_id = None
+    query_observer = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection's shortcuts create plain cursors internally; route them through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(database, settings=None, row_factory=None):
+    """Opens a connection with the busy timeout, statement cache and PRAGMAs applied."""
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    conn = sqlite3.connect(database, timeout=settings['busy_timeout'],
+                           cached_statements=settings['cached_statements'], check_same_thread=False,
+                           factory=PooledConnection)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    return conn
+
+
+def begin_immediate(conn, settings=None, on_retry=None):
+    """Starts a write transaction, retrying with backoff while another writer holds the lock.
+
+    Taking the write lock up front means the statements that follow can't fail halfway with
+    "database is locked". 'on_retry' is called once per retry (used for metrics).
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    delay = settings['lock_retry_delay']
+    for attempt in range(settings['lock_retries'] + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e) or attempt == settings['lock_retries']:
+                raise
+            if on_retry is not None:
+                on_retry()
+            time.sleep(delay)
+            delay *= 2
+
+
+class ConnectionPool:
+    """Keeps warm connections to one database file and hands them out per request.
+
+    Connections are created with check_same_thread=False and used by one thread at a time: a request
+    acquires one, and release() rolls back anything left open before it goes back on the idle stack.
+    If the database file is replaced (e.g. 'flask init-db'), idle connections to the old file are dropped.
+    """
+
+    def __init__(self, database, settings=None, row_factory=None):
+        self.database = database
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.row_factory = row_factory
+        self._lock = threading.Lock()
+        self._idle = []
+        self._file_id = None
+        self.created = 0
+        self.in_use = 0
+        self.lock_retries = 0
+
+    def _current_file_id(self):
+        try:
+            st = os.stat(self.database)
+            return (st.st_dev, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def acquire(self):
+        file_id = self._current_file_id()
+        with self._lock:
+            if file_id != self._file_id:
+                stale, self._idle = self._idle, []
+                self._file_id = file_id
+            else:
+                stale = []
+            conn = self._idle.pop() if self._idle else None
+            self.in_use += 1
+        for old in stale:
+            old.close()
+        if conn is None:
+            try:
+                conn = connect(self.database, self.settings, self.row_factory)
+            except Exception:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+            conn.file_id = file_id
+            with self._lock:
+                self.created += 1
+        return conn
+
+    def release(self, conn):
+        conn.query_observer = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self.in_use -= 1
+            keep = len(self._idle) < self.settings['max_idle'] and conn.file_id == self._file_id
+            if keep:
+                self._idle.append(conn)
+        if not keep:
+            conn.close()
+
+    def begin_immediate(self, conn):
+        """Pool-configured begin_immediate() that also counts lock-wait retries."""
+        begin_immediate(conn, self.settings, on_retry=self._count_retry)
+
+    def _count_retry(self):
+        with self._lock:
+            self.lock_retries += 1
+
+    def stats(self):
+        with self._lock:
+            return {"open": self.in_use + len(self._idle), "in_use": self.in_use, "idle": len(self._idle),
+                    "created": self.created, "lock_retries": self.lock_retries}
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
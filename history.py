@@ -0,0 +1,165 @@
+# office-space/history.py
+"""Append-only assignment history and point-in-time reconstruction, shared by app.py and migrate_csv.py.
+
+Triggers copy every insert, update and delete on office_assignments into assignment_history inside the
+writing transaction. Every CHECKPOINT_INTERVAL events a full copy of office_assignments is stored as a
+checkpoint, in a transaction of its own (see maybe_checkpoint), so the state at a recent time is the
+nearest earlier checkpoint plus at most that many events. Only the first checkpoint and the newest
+CHECKPOINTS_KEPT are kept; moments older than those replay more events from an earlier checkpoint.
+"""
+from datetime import timezone
+
+CHECKPOINT_INTERVAL = 10000 # History events between full-state checkpoints
+CHECKPOINTS_KEPT = 8        # Newest checkpoints kept besides the first; each is a full copy of office_assignments
+
+# Columns copied into history and checkpoints (office_assignments.id is stored as occupant_id)
+HISTORY_COLUMNS = 'office_id, full_name, appointment_type, start_date, end_date, is_temporary'
+
+
+def history_schema():
+    """Non-destructive schema for the history tables and the triggers that fill them."""
+    return f"""
+    -- One row per change to office_assignments, never updated or deleted. For 'delete' the row
+    -- holds the occupant as it was just before removal. recorded_at is UTC with milliseconds.
+    CREATE TABLE IF NOT EXISTS assignment_history (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        occupant_id INTEGER NOT NULL,
+        office_id TEXT,
+        full_name TEXT,
+        appointment_type TEXT,
+        start_date TEXT,
+        end_date TEXT,
+        is_temporary BOOLEAN,
+        recorded_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_history_recorded_at ON assignment_history (recorded_at);
+
+    -- Full copies of office_assignments as of history event 'seq'
+    CREATE TABLE IF NOT EXISTS history_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        seq INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_history_checkpoints_seq ON history_checkpoints (seq);
+    CREATE TABLE IF NOT EXISTS history_checkpoint_rows (
+        checkpoint_id INTEGER NOT NULL,
+        occupant_id INTEGER NOT NULL,
+        office_id TEXT,
+        full_name TEXT,
+        appointment_type TEXT,
+        start_date TEXT,
+        end_date TEXT,
+        is_temporary BOOLEAN,
+        PRIMARY KEY (checkpoint_id, occupant_id)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS assignment_history_insert AFTER INSERT ON office_assignments BEGIN
+        INSERT INTO assignment_history (op, occupant_id, {HISTORY_COLUMNS})
+        VALUES ('insert', new.id, new.office_id, new.full_name, new.appointment_type, new.start_date, new.end_date, new.is_temporary);
+    END;
+    CREATE TRIGGER IF NOT EXISTS assignment_history_update AFTER UPDATE ON office_assignments BEGIN
+        INSERT INTO assignment_history (op, occupant_id, {HISTORY_COLUMNS})
+        VALUES ('update', new.id, new.office_id, new.full_name, new.appointment_type, new.start_date, new.end_date, new.is_temporary);
+    END;
+    CREATE TRIGGER IF NOT EXISTS assignment_history_delete AFTER DELETE ON office_assignments BEGIN
+        INSERT INTO assignment_history (op, occupant_id, {HISTORY_COLUMNS})
+        VALUES ('delete', old.id, old.office_id, old.full_name, old.appointment_type, old.start_date, old.end_date, old.is_temporary);
+    END;
+    """
+
+
+def ensure_history(db):
+    """Creates the history tables if missing. A database without checkpoints gets a baseline of its current state."""
+    db.executescript(history_schema())
+    if db.execute('SELECT 1 FROM history_checkpoints LIMIT 1').fetchone() is None:
+        take_checkpoint(db)
+        db.commit()
+
+
+def current_seq(db):
+    """The latest history event number (0 if there are none)."""
+    return db.execute('SELECT COALESCE(MAX(seq), 0) FROM assignment_history').fetchone()[0]
+
+
+def take_checkpoint(db):
+    """Copies office_assignments into a new checkpoint, in the caller's transaction."""
+    checkpoint_id = db.execute('INSERT INTO history_checkpoints (seq) VALUES (?)', [current_seq(db)]).lastrowid
+    db.execute(f'''
+        INSERT INTO history_checkpoint_rows (checkpoint_id, occupant_id, {HISTORY_COLUMNS})
+        SELECT ?, id, {HISTORY_COLUMNS} FROM office_assignments
+        ''', [checkpoint_id])
+    return checkpoint_id
+
+
+def prune_checkpoints(db):
+    """Deletes every checkpoint except the first and the newest CHECKPOINTS_KEPT, in the caller's transaction."""
+    old_ids = [(row[0],) for row in db.execute('''
+        SELECT id FROM history_checkpoints
+        WHERE id != (SELECT id FROM history_checkpoints ORDER BY seq LIMIT 1)
+        ORDER BY seq DESC LIMIT -1 OFFSET ?
+        ''', [CHECKPOINTS_KEPT]).fetchall()]
+    db.executemany('DELETE FROM history_checkpoint_rows WHERE checkpoint_id = ?', old_ids)
+    db.executemany('DELETE FROM history_checkpoints WHERE id = ?', old_ids)
+
+
+def checkpoint_due(db):
+    """True if CHECKPOINT_INTERVAL events have been recorded since the last checkpoint (one statement, cheap to poll)."""
+    pending = db.execute('''
+        SELECT (SELECT COALESCE(MAX(seq), 0) FROM assignment_history) - (SELECT COALESCE(MAX(seq), 0) FROM history_checkpoints)
+        ''').fetchone()[0]
+    return pending >= CHECKPOINT_INTERVAL
+
+
+def maybe_checkpoint(db):
+    """Takes a checkpoint (and prunes old ones) if one is due, in the caller's transaction. Returns True if it took one.
+
+    Copying office_assignments holds the write lock, so call this in a transaction of its own rather than
+    inside a request's write.
+    """
+    if not checkpoint_due(db):
+        return False
+    take_checkpoint(db)
+    prune_checkpoints(db)
+    return True
+
+
+def format_timestamp(moment):
+    """Formats an aware datetime like recorded_at ('2024-05-01T17:03:09.250Z') so the two compare as strings."""
+    moment = moment.astimezone(timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+def state_at(db, timestamp):
+    """Rows of office_assignments (id first, then HISTORY_COLUMNS) as they were at 'timestamp', ordered by office.
+
+    'timestamp' is a format_timestamp() string. Returns None if it is before the first checkpoint.
+    Reads the nearest kept checkpoint plus the events between it and 'timestamp', never the whole log.
+    """
+    first = db.execute('SELECT seq, created_at FROM history_checkpoints ORDER BY seq LIMIT 1').fetchone()
+    if first is None or timestamp < first[1]:
+        return None
+    # ORDER BY ... LIMIT 1 seeks idx_history_recorded_at; MAX(seq) with this WHERE would walk back from the newest event
+    target = db.execute('''
+        SELECT seq FROM assignment_history WHERE recorded_at <= ?
+        ORDER BY recorded_at DESC, seq DESC LIMIT 1
+        ''', [timestamp]).fetchone()
+    target = first[0] if target is None else max(target[0], first[0])
+    checkpoint_id, checkpoint_seq = db.execute(
+        'SELECT id, seq FROM history_checkpoints WHERE seq <= ? ORDER BY seq DESC LIMIT 1', [target]).fetchone()
+
+    # Occupants' last event between the checkpoint and the target replaces (or removes) their checkpoint row
+    return db.execute(f'''
+        WITH latest AS (
+            SELECT occupant_id, MAX(seq) AS seq FROM assignment_history
+            WHERE seq > ? AND seq <= ?
+            GROUP BY occupant_id
+        )
+        SELECT occupant_id AS id, {HISTORY_COLUMNS} FROM history_checkpoint_rows
+        WHERE checkpoint_id = ? AND occupant_id NOT IN (SELECT occupant_id FROM latest)
+        UNION ALL
+        SELECT h.occupant_id AS id, {', '.join('h.' + c.strip() for c in HISTORY_COLUMNS.split(','))}
+        FROM latest JOIN assignment_history h ON h.seq = latest.seq
+        WHERE h.op != 'delete'
+        ORDER BY office_id, id
+        ''', [checkpoint_seq, target, checkpoint_id]).fetchall()
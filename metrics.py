@@ -0,0 +1,145 @@
+# office-space/metrics.py
+"""Minimal Prometheus text-format metrics for app.py's /metrics endpoint, plus per-request phase timing."""
+import bisect
+import contextlib
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bucket upper bounds per kind of measurement
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, one series per label tuple."""
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in sorted(values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label tuple."""
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {} # labels -> [per-bucket counts (last one is +Inf), sum, count]
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value) # First bucket whose bound is >= value
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        lines = []
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _format_value(float(bound))
+                lines.append((f'{self.name}_bucket', _format_labels(self.labelnames, labels, [f'le="{le}"']), cumulative))
+            lines.append((f'{self.name}_sum', _format_labels(self.labelnames, labels), total))
+            lines.append((f'{self.name}_count', _format_labels(self.labelnames, labels), count))
+        return lines
+
+
+class Callback:
+    """Gauge or counter whose values are read from 'fn' at scrape time. 'fn' returns {label tuple: value}."""
+
+    def __init__(self, name, help, type, fn, labelnames=()):
+        self.name, self.help, self.type, self.fn, self.labelnames = name, help, type, fn, tuple(labelnames)
+
+    def samples(self):
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in sorted(self.fn().items())]
+
+
+class Registry:
+    """Ordered collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """The Prometheus text exposition of every registered metric."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """Seconds spent per phase of one request ('db', 'materialize', 'serialize'), plus rows fetched and queries run.
+
+    Installed as the request connection's query_observer (see db_pool.TimedCursor), so every statement
+    adds to 'db'. Statements that take 'slow_query_seconds' or longer are passed to on_slow_query(sql, params, seconds).
+    """
+
+    def __init__(self, slow_query_seconds=None, on_slow_query=None):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.rows = 0
+        self.queries = 0
+        self.slow_query_seconds = slow_query_seconds
+        self.on_slow_query = on_slow_query
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def __call__(self, sql, params, seconds, rows, queries, statement_seconds):
+        self.add('db', seconds)
+        self.rows += rows
+        self.queries += queries
+        if (statement_seconds is not None and self.slow_query_seconds is not None
+                and statement_seconds >= self.slow_query_seconds and self.on_slow_query is not None):
+            self.on_slow_query(sql, params, statement_seconds)
@@ -1,12 +1,21 @@
 # office-space/migrate_csv.py
+import argparse
+import concurrent.futures
 import csv
+import functools
+import glob
+import itertools
+import json
 import sqlite3
-import sys
 import os
+import sys
 from datetime import datetime
 
+import db_pool
+import history
 
-# --- Configuration and Helper functions remain the same ---
+
+# --- Configuration ---
 DATABASE = 'mydatabase.db'
 EXPECTED_HEADERS_MAP = {
     'room number': 'office_id',
@@ -18,160 +27,379 @@ EXPECTED_HEADERS_MAP = {
 ESSENTIAL_DB_COLUMNS = ['office_id', 'full_name']
 CSV_HAS_HEADER = True
 CSV_ENCODING = 'utf-8'
+INSERT_CHUNK_SIZE = 1000       # Rows per executemany() call
+BULK_CHANGE_THRESHOLD = 1000   # Above this many changed rows, clients are told to reload instead of replaying deltas
+WRITE_BATCH_ROWS = 50000       # Whole files are committed together until a transaction holds about this many rows
+DEFAULT_REJECTS_FILE = 'import_rejects.jsonl'
+
+# AFTER INSERT triggers on office_assignments (see app.py and history.py) that append_rows() replaces
+# with one set-based statement over the newly inserted ids (id >= ?)
+BULK_INSERT_TRIGGERS = {
+    'occupant_search_insert': '''
+        INSERT INTO occupant_search (rowid, full_name, appointment_type)
+        SELECT id, full_name, appointment_type FROM office_assignments WHERE id >= ?''',
+    'assignment_history_insert': f'''
+        INSERT INTO assignment_history (op, occupant_id, {history.HISTORY_COLUMNS})
+        SELECT 'insert', id, {history.HISTORY_COLUMNS} FROM office_assignments WHERE id >= ? ORDER BY id''',
+    'office_stats_insert': '''
+        INSERT INTO office_stats (office_id, appointment_type, occupants)
+        SELECT office_id, COALESCE(appointment_type, ''), COUNT(*) FROM office_assignments NOT INDEXED WHERE id >= ? GROUP BY 1, 2
+        ON CONFLICT (office_id, appointment_type) DO UPDATE SET occupants = occupants + excluded.occupants''',
+}
+
+# Column order of the row tuples produced by read_assignments()
+ROW_COLUMNS = ('office_id', 'full_name', 'appointment_type', 'start_date', 'end_date', 'is_temporary')
 
+
+@functools.lru_cache(maxsize=4096)
 def parse_and_format_date(date_str):
-    # (Keep the same function)
+    """Converts M/D/YY, M/D/YYYY or YYYY-MM-DD to YYYY-MM-DD, or None if it can't. Memoized: HR exports repeat the same few dates."""
     if not date_str or not date_str.strip(): return None
     date_str = date_str.strip()
     formats_to_try = ['%m/%d/%y', '%m/%d/%Y', '%Y-%m-%d']
     for fmt in formats_to_try:
         try: return datetime.strptime(date_str, fmt).strftime('%Y-%m-%d')
         except ValueError: continue
-    print(f"Warning: Could not parse date '{date_str}'. Skipping date.")
     return None
 
-def migrate_data(csv_filepath):
-    # (Initial checks remain the same)
-    if not os.path.exists(DATABASE): print(f"Error: DB '{DATABASE}' not found."); return
-    print(f"Attempting migration from: {csv_filepath}")
+
+def resolve_headers(raw_fieldnames):
+    """Maps expected lowercase headers to column indexes.
+
+    Returns (indexes, missing expected headers, missing essential headers); indexes is None if essential ones are absent.
+    """
+    actual_headers_lower = {} # Map: lowercase_header -> column index
+    for i, header in enumerate(raw_fieldnames):
+        if header is None: continue
+        processed_header_lower = header.strip().lower()
+        # Remove BOM only for the lowercase key lookup if present on first header
+        if i == 0 and processed_header_lower.startswith('\ufeff'):
+            processed_header_lower = processed_header_lower[1:]
+        actual_headers_lower[processed_header_lower] = i
+
+    indexes = {db_col: actual_headers_lower.get(expected_lower) for expected_lower, db_col in EXPECTED_HEADERS_MAP.items()}
+    missing_expected_headers = [h for h in EXPECTED_HEADERS_MAP if h not in actual_headers_lower]
+    missing_essential = [h for h in missing_expected_headers if EXPECTED_HEADERS_MAP[h] in ESSENTIAL_DB_COLUMNS]
+    return (None if missing_essential else indexes), missing_expected_headers, missing_essential
+
+
+def reject_record(path, row_number, reason, row=None, action='skipped'):
+    """One line of the reject file. 'action' is 'skipped' (row not imported), 'kept' (imported with a field dropped) or 'file skipped'."""
+    return {"file": path, "row_number": row_number, "action": action, "reason": reason, "row": row}
+
+
+def read_assignments(csvfile, indexes, stats, rejects, path):
+    """Yields one ROW_COLUMNS tuple per valid CSV data row. Problems are appended to 'rejects' and counted in 'stats'."""
+    def column(db_col):
+        # Resolve each column's position once instead of looking up header keys on every row
+        index = indexes[db_col]
+        if index is None: return lambda row: ''
+        return lambda row: row[index].strip() if index < len(row) else ''
+
+    get_office, get_name, get_appt = column('office_id'), column('full_name'), column('appointment_type')
+    get_start, get_end = column('start_date'), column('end_date')
+
+    for row_number, row in enumerate(csvfile, start=2):
+        stats['processed_rows'] += 1
+        try:
+            office_id_val = get_office(row)
+            full_name_val = get_name(row)
+
+            # Essential data validation
+            if not office_id_val or not full_name_val:
+                rejects.append(reject_record(path, row_number, "Missing essential data (Room Number or Full Name)", row))
+                stats['skipped_count'] += 1
+                continue
+
+            raw_start, raw_end = get_start(row), get_end(row)
+            start_date_iso = parse_and_format_date(raw_start)
+            end_date_iso = parse_and_format_date(raw_end)
+            for label, raw, parsed in (('Start Date', raw_start, start_date_iso), ('End Date', raw_end, end_date_iso)):
+                if raw and parsed is None:
+                    rejects.append(reject_record(path, row_number, f"Could not parse {label} '{raw}'; imported without it", row, action='kept'))
+            # A blank Appointment Type is stored as NULL, like a missing date, so /api/export round-trips
+            yield (office_id_val, full_name_val, get_appt(row) or None, start_date_iso, end_date_iso, bool(end_date_iso))
+
+        except Exception as e:
+            rejects.append(reject_record(path, row_number, f"Error processing row: {e}", row))
+            stats['skipped_count'] += 1
+
+
+def parse_file(path):
+    """Reads and validates one CSV file. Runs in a worker process, so it only returns data and never touches the database.
+
+    Returns {path, rows, processed_rows, skipped_count, rejects, missing_headers, error}; 'error' is set (and
+    'rows' empty) when the file as a whole can't be used.
+    """
+    result = {"path": path, "rows": [], "processed_rows": 0, "skipped_count": 0, "rejects": [], "missing_headers": [], "error": None}
+
+    def fail(reason):
+        result["error"] = reason
+        result["rows"] = []
+        result["rejects"].append(reject_record(path, None, reason, action='file skipped'))
+        return result
+
+    if not CSV_HAS_HEADER: return fail("Script requires headers")
+    try:
+        with open(path, mode='r', newline='', encoding=CSV_ENCODING) as csvfile:
+            csvreader = csv.reader(csvfile)
+            raw_fieldnames = next(csvreader, None)
+            if not raw_fieldnames: return fail("Could not read headers")
+            result["processed_rows"] += 1
+
+            indexes, result["missing_headers"], missing_essential = resolve_headers(raw_fieldnames)
+            if indexes is None:
+                return fail(f"Essential header(s) missing: {', '.join(missing_essential)}")
+            result["rows"] = list(read_assignments(csvreader, indexes, result, result["rejects"], path))
+    except FileNotFoundError: return fail("File not found")
+    except (OSError, UnicodeDecodeError, csv.Error) as e: return fail(f"Could not read file: {e}") # e.g. a directory or no permission
+    return result
+
+
+def expand_paths(patterns):
+    """CSV paths named by 'patterns': files as given, every *.csv in a directory, or a glob's matches (both sorted, files only)."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(path for path in glob.glob(os.path.join(pattern, '*.csv')) if os.path.isfile(path))
+        elif any(char in pattern for char in '*?['):
+            matches = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+        else:
+            matches = [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def parse_files(paths, workers):
+    """Yields parse_file() results in 'paths' order, parsing up to 'workers' files at once in separate processes."""
+    if workers <= 1 or len(paths) <= 1:
+        yield from map(parse_file, paths)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        yield from pool.map(parse_file, paths)
+
+
+def chunked(iterable, size):
+    """Yields lists of up to 'size' items from 'iterable'."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def append_rows(cursor, rows):
+    """Inserts every row in chunks. Returns the list of (op, occupant_id, office_id) changes."""
+    first_new_id = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM office_assignments").fetchone()[0]
+    # Firing the insert triggers row by row is several times slower than one set-based statement each,
+    # so drop them for the duration of the load (same transaction) and apply them to the new rows afterwards
+    triggers = cursor.execute(f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ({','.join('?' * len(BULK_INSERT_TRIGGERS))})
+    """, list(BULK_INSERT_TRIGGERS)).fetchall()
+    for name, _ in triggers: cursor.execute(f"DROP TRIGGER {name}")
+    for chunk in chunked(rows, INSERT_CHUNK_SIZE):
+        cursor.executemany('''
+            INSERT INTO office_assignments
+            (office_id, full_name, appointment_type, start_date, end_date, is_temporary)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', chunk)
+    for name, trigger_sql in triggers:
+        cursor.execute(BULK_INSERT_TRIGGERS[name], (first_new_id,))
+        cursor.execute(trigger_sql)
+    # AUTOINCREMENT ids only grow, so everything at or above first_new_id is ours
+    cursor.execute("SELECT id, office_id FROM office_assignments WHERE id >= ? ORDER BY id", (first_new_id,))
+    return [('insert', occupant_id, office_id) for occupant_id, office_id in cursor.fetchall()]
+
+
+def sync_rows(cursor, rows):
+    """Diffs the CSV rows against office_assignments and applies only what changed.
+
+    Rows are matched on (Room Number, Full Name). Matches with different appointment type or dates are
+    updated, unmatched CSV rows are inserted, and occupants missing from the CSV are deleted.
+    Returns the list of (op, occupant_id, office_id) changes.
+    """
+    existing = {} # (office_id, full_name) -> list of current rows, oldest first
+    cursor.execute('''
+        SELECT id, office_id, full_name, appointment_type, start_date, end_date, is_temporary
+        FROM office_assignments ORDER BY id
+    ''')
+    for db_row in cursor:
+        existing.setdefault((db_row[1], db_row[2]), []).append(db_row)
+
+    to_insert, to_update = [], []
+    for row in rows:
+        matches = existing.get((row[0], row[1]))
+        if not matches:
+            to_insert.append(row)
+            continue
+        current = matches.pop(0)
+        if ((current[3] or '', current[4], current[5], bool(current[6])) != (row[2] or '', row[3], row[4], row[5])):
+            to_update.append((row[2], row[3], row[4], row[5], current[0], current[1]))
+    to_delete = [(db_row[0], db_row[1]) for matches in existing.values() for db_row in matches]
+
+    changes = []
+    # Updated rows get a new version so conditional writes from the app (If-Match) see the change.
+    # Databases the app hasn't opened since rows were versioned have no version column yet.
+    columns = {column[1] for column in cursor.execute("PRAGMA table_info(office_assignments)")}
+    bump_version = ", version = version + 1" if 'version' in columns else ""
+    for chunk in chunked(to_update, INSERT_CHUNK_SIZE):
+        cursor.executemany(f'''
+            UPDATE office_assignments
+            SET appointment_type = ?, start_date = ?, end_date = ?, is_temporary = ?{bump_version}
+            WHERE id = ?
+        ''', [update[:5] for update in chunk])
+        changes.extend(('update', update[4], update[5]) for update in chunk)
+    for chunk in chunked(to_delete, INSERT_CHUNK_SIZE):
+        cursor.executemany("DELETE FROM office_assignments WHERE id = ?", [(occupant_id,) for occupant_id, _ in chunk])
+        changes.extend(('delete', occupant_id, office_id) for occupant_id, office_id in chunk)
+    if to_insert: changes.extend(append_rows(cursor, to_insert))
+    print(f"Sync: {len(to_insert)} to insert, {len(to_update)} to update, {len(to_delete)} to delete.")
+    return changes
+
+
+def log_changes(cursor, changes):
+    """Bumps the shared data version (see app.py) and logs the changes in the current transaction.
+
+    Small change sets get one change_log row each so /api/changes clients receive deltas; large ones
+    are recorded as a single 'reset' that makes clients reload.
+    """
+    if not changes: return
+    try:
+        if len(changes) > BULK_CHANGE_THRESHOLD:
+            cursor.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+            cursor.execute("INSERT INTO change_log (version, op) SELECT version, 'reset' FROM data_version WHERE id = 1")
+            return
+        # Reserve one version per change, then log them all in one statement
+        base = cursor.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+        cursor.execute("UPDATE data_version SET version = version + ? WHERE id = 1", (len(changes),))
+        cursor.executemany("INSERT INTO change_log (version, op, occupant_id, office_id) VALUES (?, ?, ?, ?)",
+                           [(base + i, op, occupant_id, office_id) for i, (op, occupant_id, office_id) in enumerate(changes, start=1)])
+    except sqlite3.OperationalError as e:
+        # Older database the app has never opened: nothing can have cached it yet
+        if "no such table" not in str(e): raise
+
+
+def commit_changes(conn, cursor, changes):
+    """Logs 'changes' for running app processes and commits, then takes a history checkpoint if one is due."""
+    log_changes(cursor, changes)
+    conn.commit()
+    # The rows themselves were recorded by the history triggers; the checkpoint copy gets its own transaction
+    try: history.maybe_checkpoint(cursor)
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e): raise
+    conn.commit()
+
+
+def write_rejects(rejects_path, results):
+    """Writes every reject of every file to 'rejects_path' as JSON Lines (an empty file means nothing was rejected)."""
+    with open(rejects_path, 'w', encoding='utf-8') as f:
+        for result in results:
+            for record in result["rejects"]:
+                f.write(json.dumps(record) + '\n')
+
+
+def import_files(patterns, sync=False, workers=None, rejects_path=None):
+    """Loads every CSV named by 'patterns' (files, directories or globs) into office_assignments.
+
+    Files are parsed and validated in up to 'workers' processes (default: one per core) while this process,
+    the only writer, commits whole files in transactions of about WRITE_BATCH_ROWS rows. A file that can't be
+    read is skipped and reported; rows with problems go to 'rejects_path' (JSON Lines). With sync=True the
+    table is made to match all files together in one transaction, and nothing is written if any file fails.
+    Returns True if every file was imported.
+    """
+    if not os.path.exists(DATABASE): print(f"Error: DB '{DATABASE}' not found."); return False
+    paths = expand_paths(patterns)
+    if not paths: print(f"Error: No CSV files match {' '.join(patterns)}"); return False
+    workers = workers or os.cpu_count() or 1
+    print(f"Attempting {'sync' if sync else 'migration'} from {len(paths)} file(s) with {min(workers, len(paths))} parser process(es)")
     print(f"Into table 'office_assignments' in db: {DATABASE}")
-    inserted_count, skipped_count, processed_rows = 0, 0, 0
+
+    results = []
+    counts = dict.fromkeys(('insert', 'update', 'delete'), 0) # Changes written, for the summary
     conn = None
+    ok = True
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = db_pool.connect(DATABASE) # WAL + busy timeout, so a running app keeps serving reads
         cursor = conn.cursor()
         try: cursor.execute("SELECT 1 FROM office_assignments LIMIT 1")
         except sqlite3.OperationalError as e:
-            if "no such table" in str(e): print(f"Error: Table missing. Run 'flask init-db'."); return
+            if "no such table" in str(e): print(f"Error: Table missing. Run 'flask init-db'."); return False
             else: raise
 
-        with open(csv_filepath, mode='r', newline='', encoding=CSV_ENCODING) as csvfile:
-            if not CSV_HAS_HEADER: print("Error: Script requires headers."); return
-
-            csvreader = csv.DictReader(csvfile)
-            raw_fieldnames = csvreader.fieldnames
-            if not raw_fieldnames: print("Error: Could not read headers."); return
-
-            # --- CORRECTED HEADER PROCESSING ---
-            actual_headers_lower = {} # Map: lowercase_header -> original_header (with BOM if present)
-            processed_headers_for_display = [] # Just for printing clearly
-            for i, header in enumerate(raw_fieldnames):
-                if header is None: continue
-                original_header_stripped = header.strip() # Store the key exactly as DictReader provides it (stripped)
-                processed_header_lower = original_header_stripped.lower()
-
-                # Remove BOM only for the lowercase key lookup if present on first header
-                if i == 0 and processed_header_lower.startswith('\ufeff'):
-                    processed_header_lower = processed_header_lower[1:]
-                    print(f"Note: Removed BOM from first header key for matching: '{header}'")
-
-                # Store map: lowercase_cleaned_key -> original_stripped_key (potentially with BOM)
-                actual_headers_lower[processed_header_lower] = original_header_stripped
-                processed_headers_for_display.append(processed_header_lower) # Add cleaned version for display
-            # --- END CORRECTED HEADER PROCESSING ---
-
-            print(f"Processed CSV Headers (lowercase keys used for mapping): {processed_headers_for_display}")
-
-            # (Header warning checks remain the same, using actual_headers_lower keys)
-            found_headers_map = {}
-            missing_expected_headers = []
-            for expected_lower, db_col in EXPECTED_HEADERS_MAP.items():
-                 # Use the processed lowercase keys for checking existence
-                if expected_lower in actual_headers_lower:
-                    # Store the map: expected_lower -> original_header_name (value from actual_headers_lower)
-                    found_headers_map[expected_lower] = actual_headers_lower[expected_lower]
-                else:
-                    missing_expected_headers.append(expected_lower)
-
-            if missing_expected_headers:
-                 print("\n--- Header Warnings ---")
-                 # (Warning print logic remains the same)
-                 print("Warning: The following expected headers were NOT found (using lowercase):")
-                 for h in missing_expected_headers: print(f" - '{h}' (needed for DB column '{EXPECTED_HEADERS_MAP[h]}')")
-                 print("Will proceed using defaults for missing optional columns.")
-                 print("---------------------\n")
-
-            missing_essential = False
-            for db_col in ESSENTIAL_DB_COLUMNS:
-                 expected_key = next((k for k, v in EXPECTED_HEADERS_MAP.items() if v == db_col), None)
-                 # Check if the *lowercase* key exists in the map we built
-                 if expected_key not in actual_headers_lower: # Check against the keys derived from file
-                      print(f"Error: Essential header '{expected_key}' (for DB column '{db_col}') is missing. Cannot proceed.")
-                      missing_essential = True
-            if missing_essential: return
-
-            processed_rows += 1
-
-            for row_number, row in enumerate(csvreader, start=2):
-                processed_rows += 1
-                try:
-                    # Get the actual header key (original case, potentially with BOM) from the map
-                    room_header_key = found_headers_map.get('room number')
-                    name_header_key = found_headers_map.get('full name')
-
-                    # Extract data using the correct key
-                    office_id_val = row.get(room_header_key, '').strip() if room_header_key else ''
-                    full_name_val = row.get(name_header_key, '').strip() if name_header_key else ''
-
-                    # Essential data validation
-                    if not office_id_val or not full_name_val:
-                        print(f"Skipping row {row_number}: Missing essential data (Room Number or Full Name). Row data: {row}")
-                        skipped_count += 1
-                        continue
-
-                    # Extract optional data
-                    appt_type_header_key = found_headers_map.get('appointment type')
-                    start_date_header_key = found_headers_map.get('start date')
-                    end_date_header_key = found_headers_map.get('end date')
-                    appt_type_val = row.get(appt_type_header_key, '').strip() if appt_type_header_key else ''
-                    start_date_str = row.get(start_date_header_key, '').strip() if start_date_header_key else ''
-                    end_date_str = row.get(end_date_header_key, '').strip() if end_date_header_key else ''
-
-                    # Parse dates
-                    start_date_iso = parse_and_format_date(start_date_str)
-                    end_date_iso = parse_and_format_date(end_date_str)
-                    is_temporary = bool(end_date_iso)
-
-
-                    # Essential data validation (remains the same)
-                    if not office_id_val or not full_name_val:
-                        # ... (skip logic remains the same)
-                        continue
-
-                    # ... (existing code to parse dates, etc.)
-
-                    # Insert data - MODIFIED statement and parameters
-                    cursor.execute('''
-                        INSERT INTO office_assignments
-                        (office_id, full_name, appointment_type, start_date, end_date, is_temporary)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (office_id_val, full_name_val, appt_type_val, start_date_iso, end_date_iso, is_temporary)) # Removed area_name_val
-                    inserted_count += 1
-
-                except Exception as e:
-                    print(f"Error processing row {row_number}: {row} - Error: {e}")
-                    skipped_count += 1
-
-        # (Commit, Summary, and Finally block remain the same)
-        conn.commit()
-        print("\n--- Migration Summary ---")
-        print(f"Processed {processed_rows} rows (including header).")
-        print(f"Successfully inserted {inserted_count} entries into 'office_assignments'.")
-        print(f"Skipped {skipped_count} rows due to errors or missing essential data.")
-        if missing_expected_headers: print(f"Note: Warnings were issued for missing headers: {missing_expected_headers}")
-
-    except FileNotFoundError: print(f"\nError: CSV file not found at '{csv_filepath}'")
-    except sqlite3.Error as e: print(f"\nDatabase error: {e}"); conn.rollback() if conn else None
-    except Exception as e: print(f"\nAn unexpected error occurred: {e}"); conn.rollback() if conn else None
+        def write(batch):
+            db_pool.begin_immediate(conn) # Waits out app writers
+            batch_changes = append_rows(cursor, itertools.chain.from_iterable(result["rows"] for result in batch))
+            commit_changes(conn, cursor, batch_changes)
+            for change in batch_changes: counts[change[0]] += 1
+            for result in batch:
+                result["imported"] = True
+                del result["rows"] # Written; only the counts and rejects are kept for the summary
+
+        batch, batch_rows = [], 0
+        for result in parse_files(paths, workers):
+            results.append(result)
+            status = f"error: {result['error']}" if result["error"] else f"{len(result['rows'])} rows, {result['skipped_count']} skipped"
+            print(f"  {result['path']}: {status}")
+            if result["error"]: ok = False; continue
+            if sync: continue # Needs every file before it can tell what was deleted
+            batch.append(result)
+            batch_rows += len(result["rows"])
+            if batch_rows >= WRITE_BATCH_ROWS:
+                write(batch)
+                batch, batch_rows = [], 0
+        if batch: write(batch)
+
+        if sync:
+            if not ok:
+                print("\nError: Not syncing because some files could not be read (a sync would delete their occupants).")
+            else:
+                db_pool.begin_immediate(conn) # One transaction: the table matches all files or none
+                changes = sync_rows(cursor, itertools.chain.from_iterable(result["rows"] for result in results))
+                commit_changes(conn, cursor, changes)
+                for change in changes: counts[change[0]] += 1
+                for result in results:
+                    result["imported"] = True
+                    del result["rows"]
+
+    except sqlite3.Error as e: print(f"\nDatabase error: {e}"); ok = False; conn.rollback() if conn else None
+    except Exception as e: print(f"\nAn unexpected error occurred: {e}"); ok = False; conn.rollback() if conn else None
     finally:
         if conn: conn.close(); print("Database connection closed.")
 
+    print("\n--- Migration Summary ---")
+    print(f"Files: {sum(1 for r in results if r.get('imported'))} imported, {sum(1 for r in results if not r.get('imported'))} not imported.")
+    print(f"Processed {sum(r['processed_rows'] for r in results)} rows (including headers).")
+    print(f"Successfully inserted {counts['insert']} entries into 'office_assignments'.")
+    if sync: print(f"Updated {counts['update']} and deleted {counts['delete']} entries.")
+    print(f"Skipped {sum(r['skipped_count'] for r in results)} rows due to errors or missing essential data.")
+    missing_headers = sorted({h for r in results if not r['error'] for h in r['missing_headers']})
+    if missing_headers: print(f"Note: Some files lack optional headers (defaults used): {missing_headers}")
+    if rejects_path:
+        write_rejects(rejects_path, results)
+        print(f"{sum(len(r['rejects']) for r in results)} problem(s) written to {rejects_path}")
+    return ok
+
+
+def migrate_data(csv_filepath, sync=False):
+    """Loads one CSV into office_assignments. With sync=True, applies only the differences."""
+    return import_files([csv_filepath], sync=sync, workers=1)
+
 
 # --- Main execution block ---
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("\nUsage: python migrate_csv.py <path_to_your_csv_file.csv>")
-        print(f"Example: python migrate_csv.py {os.path.join('.', 'assignments_dates.csv')}")
-        sys.exit(1)
-    csv_file_to_migrate = sys.argv[1]
-    migrate_data(csv_file_to_migrate)
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="Load office assignments from CSV files into the database.",
+        epilog=f"Examples: python migrate_csv.py {os.path.join('.', 'assignments_dates.csv')}  |  python migrate_csv.py exports/  |  python migrate_csv.py 'exports/*.csv'")
+    parser.add_argument('csv_files', nargs='+', metavar='csv_file',
+                        help="CSV file, directory of CSV files, or glob (Room Number, Full Name, Appointment Type, Start Date, End Date)")
+    parser.add_argument('--sync', action='store_true',
+                        help="make the table match the CSV files: insert new, update changed and delete missing occupants instead of appending")
+    parser.add_argument('--workers', type=int, default=None, help="parser processes (default: one per core)")
+    parser.add_argument('--rejects', default=DEFAULT_REJECTS_FILE, metavar='PATH',
+                        help=f"JSON Lines file listing skipped rows, dropped dates and unreadable files (default: {DEFAULT_REJECTS_FILE})")
+    args = parser.parse_args()
+    sys.exit(0 if import_files(args.csv_files, sync=args.sync, workers=args.workers, rejects_path=args.rejects) else 1)
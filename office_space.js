@@ -1,22 +1,17 @@
-// --- Define Grid Parameters ---
-const startX = 50;
-const startY = 50;
-const standardOfficeWidth = 100;
-const standardOfficeHeight = 100;
-const xGap = 20;
-const yGap = 30;
-const officesPerRow = 6; // Adjusted to fit more offices potentially per row
-const svgPadding = 50; // Padding around the layout in the SVG
+const emptyFloorSize = 100; // SVG width/height when a floor has no rooms
 
 // --- Global Data Structures ---
-let floorLayouts = { 3: {}, 4: {} }; // Holds {roomId: {x, y}} for each floor
-let floorOfficesData = { 3: {}, 4: {} }; // Intermediate data during CSV load
-let floorOffices = { 3: [], 4: [] }; // Final D3 data arrays {id, x, y, w, h, occupants}
-let currentFloor = 3; // Start by showing 3rd floor
-
-// --- Room Lists (from previous steps) ---
-const thirdFloorRooms = ['302', '303', '303A', '304', '305', '306', '310', '319', '322A', '323', '324', '325', '326', '328', '330', '330A', '331', '332', '333', '333A', '333B', '334', '335', '336', '337', '338', '339', '340', '370', '371', '372', '375', '375A', '376', '379', '381A', '382N-A'];
-const fourthFloorRooms = ['402', '404', '405', '406', '407', '409', '412', '413', '414', '419', '420', '421', '423', '424', '425', '426', '427', '428', '429', '430', '431', '433', '434', '435', '436', '437', '438', '439', '460', '461B', '462', '463', '463A', '464', '465'];
+let layout = null; // Floor plan from /api/layout: {version, floors: {floorNum: {width, height, rooms: [{office_id, x, y, width, height}]}}}
+let floorOffices = {}; // floorNum -> D3 data array {id, x, y, w, h, occupants}
+let currentFloor = null; // Set to the lowest floor in the layout once it has loaded
+let officeIndex = {}; // officeId -> office object in floorOffices
+let occupantOffice = {}; // occupantId -> office object currently holding that occupant
+let dataEpoch = null; // Server data version the client is in sync with (see /api/changes)
+let dataVersion = null;
+const changePollInterval = 15000; // ms between /api/changes polls
+
+// Rooms, their positions and sizes come from the server (rooms table) via /api/layout
+let loadedFloors = {}; // floorNum -> true once /api/floors/<n>/offices has been fetched
 
 // --- Modify drawOffices function ---
 function drawOffices() {
@@ -80,22 +75,28 @@ function getAreaClass(areaName) {
     // but it doesn't hurt to leave it.
 }
 
-// --- Function to Calculate Layout Coordinates for a Floor ---
-function calculateLayout(roomList, floorNum) {
-    const layout = {};
-    roomList.forEach((roomId, index) => {
-        const col = index % officesPerRow;
-        const row = Math.floor(index / officesPerRow);
-        const x = startX + col * (standardOfficeWidth + xGap);
-        const y = startY + row * (standardOfficeHeight + yGap);
-        layout[roomId] = { x: x, y: y };
-    });
-    floorLayouts[floorNum] = layout; // Store calculated layout
+// --- Fetch the floor plan for a layout version (X-Layout-Version) ---
+// The versioned URL is cached by the browser, so the geometry is downloaded once per layout change.
+// With version null (at startup, before any floor response named one) the current layout is fetched.
+let layoutRequest = null; // {version, promise} of the /api/layout fetch in flight, shared by concurrent floor loads
+
+function loadLayout(version) {
+    if (layout && layout.version === version) return Promise.resolve(layout);
+    if (!layoutRequest || layoutRequest.version !== version) {
+        const url = version === null ? "/api/layout" : `/api/layout?v=${encodeURIComponent(version)}`;
+        const promise = d3.json(url).then(data => {
+            if (layout) loadedFloors = {}; // Floors drawn with the old geometry need rebuilding
+            const floors = {};
+            data.floors.forEach(floor => { floors[floor.floor] = floor; });
+            layout = { version: data.version, floors: floors };
+            renderFloorButtons();
+            return layout;
+        }).catch(error => { layoutRequest = null; throw error; }); // Let the next load retry
+        layoutRequest = { version: version, promise: promise };
+    }
+    return layoutRequest.promise;
 }
 
-// --- Calculate Layouts for Both Floors ---
-calculateLayout(thirdFloorRooms, 3);
-calculateLayout(fourthFloorRooms, 4);
 
 
 // --- Helper function to convert M/D/YY or MM/DD/YY to YYYY-MM-DD ---
@@ -108,93 +109,179 @@ function formatDateForInput(dateString) { /* ... (keep unchanged) ... */
 
 // ... (other code) ...
 
-// --- Fetch data from the API ---
-d3.json("/api/offices").then(apiData => {
-    // Clear previous intermediate data (might not be needed if API is source of truth)
-    // floorOfficesData = { 3: {}, 4: {} }; // Likely not needed anymore
-    floorOffices = { 3: [], 4: [] }; // Reset final arrays
-
-    // Process the data returned from the API (NEW STRUCTURE)
-    for (const officeId in apiData) {
-        const officeInfo = apiData[officeId]; // Contains occupants list
-        const occupants = officeInfo.occupants;
+// --- Map an API occupant to the client structure ---
+function toClientOccupant(occ) {
+    return {
+        id: occ.occupant_id,
+        name: occ.full_name,
+        startDate: occ.start_date,
+        endDate: occ.end_date,
+        temporary: occ.temporary,
+        version: occ.version // Send back as If-Match when saving, so concurrent edits get a 412 instead of being overwritten
+    };
+}
 
+// --- Compact (columnar) API responses ---
+// The server sends each office's occupants as parallel columns when asked for this media type; a null
+// column means "all null" (all false for 'temporary'), and appointment types index a shared list.
+const COLUMNAR_MIMETYPE = "application/vnd.office-space.columnar+json";
+
+function decodeColumnarOccupants(columns, doc) {
+    if (!columns) return []; // Empty office
+    const count = columns[doc.columns.indexOf("occupant_id")].length;
+    const occupants = [];
+    for (let i = 0; i < count; i++) {
+        const occ = {};
+        doc.columns.forEach((field, c) => {
+            const value = columns[c] ? columns[c][i] : null;
+            if (field === "appointment_type") occ[field] = value === null ? null : doc.appointment_types[value];
+            else if (field === "temporary") occ[field] = Boolean(value);
+            else occ[field] = value;
+        });
+        occupants.push(occ);
+    }
+    return occupants;
+}
 
-        const floorNum = officeId.startsWith('3') ? 3 : officeId.startsWith('4') ? 4 : null;
-        if (!floorNum) continue; // Skip if not 3rd or 4th floor
+// Columnar floor document -> the regular {offices: [{office_id, occupants}]} shape
+function decodeColumnarFloor(doc) {
+    return { floor: doc.floor, offices: doc.offices.map(([officeId, columns]) => ({ office_id: officeId, occupants: decodeColumnarOccupants(columns, doc) })) };
+}
 
-        const layout = floorLayouts[floorNum][officeId]; // Get layout for this floor/office
-        if (!layout) {
-            console.warn(`Office ID ${officeId} found in API data but not in predefined layout for floor ${floorNum}. Skipping.`);
-            continue; // Skip if office isn't in our defined layout
+// --- Fetch one floor's offices from the API ---
+function loadFloor(floorNum) {
+    const headers = { Accept: `${COLUMNAR_MIMETYPE}, application/json;q=0.9` };
+    let layoutVersion = null;
+    return fetch(`/api/floors/${floorNum}/offices`, { headers }).then(response => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const epoch = response.headers.get("X-Data-Epoch");
+        const version = Number(response.headers.get("X-Data-Version"));
+        if (dataVersion === null || epoch !== dataEpoch) {
+            // First floor loaded, or the database was re-created: other floors are stale
+            if (dataVersion !== null) loadedFloors = {};
+            dataEpoch = epoch;
+            dataVersion = version;
         }
-
-        // Prepare occupant data (mapping remains the same, just using 'occupants' array)
-        const processedOccupants = occupants.map(occ => ({
-            id: occ.occupant_id,
-            name: occ.full_name,
-            startDate: occ.start_date,
-            endDate: occ.end_date,
-            temporary: occ.temporary
+        // Otherwise keep the older version: the next /api/changes poll replays the gap,
+        // and re-applying changes this floor already reflects is harmless.
+        layoutVersion = response.headers.get("X-Layout-Version");
+        const columnar = (response.headers.get("Content-Type") || "").startsWith(COLUMNAR_MIMETYPE);
+        return response.json().then(data => columnar ? decodeColumnarFloor(data) : data);
+    }).then(apiData => loadLayout(layoutVersion).then(() => apiData)).then(apiData => {
+        // Geometry from the layout; occupants matched to rooms by ID
+        const occupantsByOffice = new Map(apiData.offices.map(office => [office.office_id, office.occupants]));
+        const floorLayout = layout.floors[floorNum] || { rooms: [] };
+        floorOffices[floorNum] = floorLayout.rooms.map(room => ({
+            id: room.office_id,
+            x: room.x,
+            y: room.y,
+            width: room.width,
+            height: room.height,
+            occupants: (occupantsByOffice.get(room.office_id) || []).map(toClientOccupant)
         }));
 
-        // Add to the final data structure for D3
-        floorOffices[floorNum].push({
-            id: officeId,
-            x: layout.x,
-            y: layout.y,
-            width: standardOfficeWidth,
-            height: standardOfficeHeight,
-            occupants: processedOccupants
-
+        // Index offices and occupants so deltas from /api/changes can be applied without scanning
+        floorOffices[floorNum].forEach(office => {
+            officeIndex[office.id] = office;
+            office.occupants.forEach(occ => { occupantOffice[occ.id] = office; });
         });
-    }
-
-    // --- Optional: Handle offices from the layout that might NOT be in the API data ---
-    // This logic might need adjustment depending on whether the API now includes empty offices
-    // (based on the optional enhancement mentioned in the Python code).
-    // If the API *only* returns offices present in the DB, you might still need
-    // to add layout-only offices here, potentially without an area_name if it's not available.
-    for (let floorNum of [3, 4]) {
-        const layoutRooms = Object.keys(floorLayouts[floorNum]);
-        const apiRooms = floorOffices[floorNum].map(o => o.id);
-        layoutRooms.forEach(roomId => {
-            if (!apiRooms.includes(roomId)) {
-                 console.log(`Office ${roomId} is in layout but not in API data (likely empty or not in DB).`);
-                // If you want to display empty offices from the layout with area colors,
-                // you'd need to ensure the migration adds them OR replicate the
-                // get_area_name logic in JS or pass it via another mechanism.
-                // Simplest is ensuring they are in the DB via migrate_csv.py.
-                // Example of adding without area color:
-                 const layout = floorLayouts[floorNum][roomId];
-                 floorOffices[floorNum].push({
-                     id: roomId, x: layout.x, y: layout.y, width: standardOfficeWidth,
-                     height: standardOfficeHeight, occupants: [] // No area name available here
-                 });
-            }
-        });
-         // Optional: Sort offices by ID within each floor
-        floorOffices[floorNum].sort((a, b) => a.id.localeCompare(b.id, undefined, {numeric: true}));
-    }
-
+        loadedFloors[floorNum] = true;
+    });
+}
 
-    // --- Display the initial floor ---
-    displayFloor(currentFloor); // Show default floor (3rd)
+// --- Drop everything and reload the current floor (after a reset from /api/changes) ---
+function reloadOffices() {
+    floorOffices = {};
+    officeIndex = {};
+    occupantOffice = {};
+    loadedFloors = {};
+    dataEpoch = null;
+    dataVersion = null;
+    displayFloor(currentFloor);
+}
 
-}).catch(error => {
+function showLoadError(error) {
     console.error("Error fetching office data from API:", error);
     // Display an error message to the user on the page
     d3.select("body").insert("div", ":first-child")
         .attr("style", "background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; padding: 15px; margin: 10px; border-radius: 4px;")
         .html("<strong>Error:</strong> Could not load office data from the server. Please ensure the backend server is running and the database is initialized/migrated. <br><pre>" + error + "</pre>");
-});
+}
+
+// --- Poll for incremental changes and patch only the affected offices ---
+function pollChanges() {
+    if (dataVersion === null) return; // Initial load not finished yet
+    d3.json(`/api/changes?since=${dataVersion}&epoch=${encodeURIComponent(dataEpoch)}`).then(delta => {
+        if (delta.reset) { reloadOffices(); return; } // Server can't bridge the gap; take a fresh snapshot
+        applyChanges(delta.changes);
+        dataEpoch = delta.epoch;
+        dataVersion = delta.version;
+    }).catch(error => console.warn("Could not fetch changes:", error));
+}
+
+function applyChanges(changes) {
+    if (!changes.length) return;
+    const touched = new Set();
+    changes.forEach(change => applyChange(change, touched));
+
+    drawOffices(touched);
+    // Refresh an open popup's list unless the user is in the middle of editing
+    if (currentOfficeData && touched.has(currentOfficeData.id) && currentEditingOccupantIndex === -1) {
+        populateOccupantList(currentOfficeData.occupants);
+    }
+}
+
+function applyChange(change, touched) {
+    const previous = occupantOffice[change.occupant_id];
+    const target = change.op === "delete" ? null : officeIndex[change.office_id];
+
+    if (previous && previous !== target) {
+        previous.occupants = previous.occupants.filter(o => o.id !== change.occupant_id);
+        delete occupantOffice[change.occupant_id];
+        touched.add(previous.id);
+    }
+    if (!target) return; // Deleted, or the office isn't in our layout
+
+    const occupant = toClientOccupant(change.occupant);
+    const index = target.occupants.findIndex(o => o.id === occupant.id);
+    if (index > -1) { target.occupants[index] = occupant; } else { target.occupants.push(occupant); }
+    occupantOffice[occupant.id] = target;
+    touched.add(target.id);
+}
+
+// --- Live updates: patch offices as the server pushes changes (falls back to polling) ---
+let streamConnected = false;
+
+function subscribeToChanges() {
+    if (!window.EventSource) return; // Polling only
+    const source = new EventSource("/api/stream");
+    source.onopen = () => { streamConnected = true; };
+    source.onerror = () => { streamConnected = false; }; // EventSource reconnects by itself
+    source.addEventListener("hello", event => syncTo(JSON.parse(event.data)));
+    source.addEventListener("sync", event => syncTo(JSON.parse(event.data)));
+    source.addEventListener("change", event => {
+        const change = JSON.parse(event.data);
+        if (dataVersion === null || change.version <= dataVersion) return; // Already applied
+        if (change.version !== dataVersion + 1) { pollChanges(); return; } // Missed something; fetch the gap
+        applyChanges([change]);
+        dataVersion = change.version;
+    });
+}
+
+// Catch up through /api/changes when the server's version differs from ours
+function syncTo(serverKey) {
+    if (dataVersion === null) return;
+    if (serverKey.epoch !== dataEpoch || serverKey.version !== dataVersion) pollChanges();
+}
+
+subscribeToChanges();
+setInterval(() => { if (!streamConnected) pollChanges(); }, changePollInterval);
 
 // ... (rest of office_space.js remains the same - drawOffices function correctly uses d.area_name)
 
 // --- D3 Selections ---
 const svg = d3.select("#office-layout");
-const floorBtn3 = d3.select("#floor-btn-3");
-const floorBtn4 = d3.select("#floor-btn-4");
+const floorToggle = d3.select(".floor-toggle");
 // ... (rest of selections remain the same) ...
 const editContainer = d3.select("#edit-container"); const editBackdrop = d3.select("#edit-backdrop"); const occupantListDiv = d3.select("#occupant-list"); const editFieldsDiv = d3.select("#edit-fields"); const editNameInput = d3.select("#edit-name"); const editStartDateInput = d3.select("#edit-start-date"); const editEndDateInput = d3.select("#edit-end-date"); const editTempCheckbox = d3.select("#edit-temp"); const dateFieldsDiv = d3.select("#date-fields"); const editModeLabel = d3.select("#edit-mode-label"); const saveOccupantButton = d3.select("#save-occupant-button"); const deleteOccupantButton = d3.select("#delete-occupant-button");
 
@@ -202,31 +289,68 @@ const editContainer = d3.select("#edit-container"); const editBackdrop = d3.sele
 let currentOfficeData = null; // Data of the office being edited
 let currentEditingOccupantIndex = -1;
 
+// --- Display the initial floor ---
+// The floors (and their buttons) come from the layout; start on the lowest one
+loadLayout(null).then(() => {
+    const floorNums = layoutFloorNumbers();
+    if (floorNums.length > 0) displayFloor(floorNums[0]);
+}).catch(showLoadError);
+
+
+// --- Floor buttons, one per floor in the layout ---
+function layoutFloorNumbers() {
+    return Object.keys(layout.floors).map(Number).sort((a, b) => a - b);
+}
+
+function floorLabel(floorNum) {
+    const lastTwo = Math.abs(floorNum) % 100;
+    const suffix = (lastTwo >= 11 && lastTwo <= 13) ? "th" : ({ 1: "st", 2: "nd", 3: "rd" }[lastTwo % 10] || "th");
+    return `${floorNum}${suffix} Floor`;
+}
+
+function renderFloorButtons() {
+    floorToggle.selectAll("button.floor-button")
+        .data(layoutFloorNumbers(), d => d)
+        .join(enter => enter.append("button")
+            .attr("class", "floor-button")
+            .attr("id", d => `floor-btn-${d}`)
+            .text(floorLabel)
+            .on("click", (event, d) => displayFloor(d)))
+        .order()
+        .classed("active", d => d === currentFloor);
+}
+
 
 // --- Function to Display a Specific Floor ---
 function displayFloor(floorNum) {
-    if (floorNum !== 3 && floorNum !== 4) return; // Basic validation
+    if (!layout || !layout.floors[floorNum]) return; // Not a floor in the layout
 
     currentFloor = floorNum;
     console.log("Displaying Floor:", currentFloor);
 
     // Update button active states
-    floorBtn3.classed("active", currentFloor === 3);
-    floorBtn4.classed("active", currentFloor === 4);
+    floorToggle.selectAll("button.floor-button").classed("active", d => d === currentFloor);
+
+    // Fetch the floor on first view; only the displayed floor is downloaded
+    if (!loadedFloors[floorNum]) {
+        loadFloor(floorNum).then(() => {
+            if (currentFloor === floorNum) displayFloor(floorNum); // User may have switched meanwhile
+        }).catch(showLoadError);
+        return;
+    }
 
-    // Adjust SVG size based on the selected floor's data
+    // Size the SVG to the floor's drawing (computed by the server with the layout)
     const officesToDraw = floorOffices[currentFloor];
     if (!officesToDraw || officesToDraw.length === 0) {
-         svg.attr("width", startX + svgPadding) // Minimal size if no offices
-            .attr("height", startY + svgPadding);
+         svg.attr("width", emptyFloorSize) // Minimal size if no offices
+            .attr("height", emptyFloorSize);
           svg.selectAll("g.office-group").remove(); // Clear SVG
          return;
     }
 
-    const maxX = d3.max(officesToDraw, d => d.x + d.width) || startX;
-    const maxY = d3.max(officesToDraw, d => d.y + d.height) || startY;
-    svg.attr("width", maxX + svgPadding)
-       .attr("height", maxY + svgPadding);
+    const floorLayout = layout.floors[currentFloor];
+    svg.attr("width", floorLayout.width)
+       .attr("height", floorLayout.height);
 
     // Draw the offices for the current floor
     drawOffices();
@@ -235,7 +359,8 @@ function displayFloor(floorNum) {
 
 // --- Draw Offices for the CURRENT floor ---
 // (Renamed from initializeOffices, uses global currentFloor)
-function drawOffices() {
+// Pass a Set of office IDs to re-render occupant text for just those offices.
+function drawOffices(onlyOfficeIds) {
     const officesToDraw = floorOffices[currentFloor]; // Get data for the active floor
 
     console.log(`Drawing ${officesToDraw.length} offices for Floor ${currentFloor}`);
@@ -266,18 +391,14 @@ function drawOffices() {
                 return g;
             },
             update => { // Elements to update (e.g., if data changes but office exists)
+                // Skip offices whose occupants didn't change
+                const changed = onlyOfficeIds ? update.filter(d => onlyOfficeIds.has(d.id)) : update;
                  // Update position if needed (though layout is fixed now)
-                update.attr("transform", d => `translate(${d.x}, ${d.y})`);
-                 // Update occupants
-                update.each(function(d) { updateOccupantTextsMultiline(d3.select(this), d); });
-                 // Update classes in case occupancy changes
-                update.attr("class", d => `office-group ${d.occupants && d.occupants.length > 0 ? "occupied" : ""} ${getAreaClass(d.area_name)}`)
-                 // Update position if needed (though layout is fixed now)
-                update.attr("transform", d => `translate(${d.x}, ${d.y})`);
+                changed.attr("transform", d => `translate(${d.x}, ${d.y})`);
                  // Update occupants
-                update.each(function(d) { updateOccupantTextsMultiline(d3.select(this), d); });
+                changed.each(function(d) { updateOccupantTextsMultiline(d3.select(this), d); });
                  // Update classes in case occupancy changes
-                update.attr("class", d => `office-group ${d.occupants && d.occupants.length > 0 ? "occupied" : ""}`);
+                changed.attr("class", d => `office-group ${d.occupants && d.occupants.length > 0 ? "occupied" : ""}`);
                 return update;
             },
             exit => exit.remove() // Remove groups for offices not on this floor
@@ -0,0 +1,57 @@
+# office-space/result_cache.py
+"""Bounded in-process cache for read results, kept correct across worker processes by a shared version.
+
+Every entry remembers the version it was built at. Callers read the current version from the database
+on each request (app.py uses the data_version/layout_version counter rows, which every writer bumps --
+other workers and migrate_csv.py included) and pass it to get(); an entry built at any other version is
+a miss. So a worker serves from memory until a write lands anywhere, and never serves what was true
+before it. Entries beyond 'max_entries' are evicted least recently used first, and none outlives 'ttl'
+seconds, which bounds the damage of a write that bypasses the counters (e.g. a manual sqlite3 session).
+"""
+import collections
+import threading
+import time
+
+
+class ResultCache:
+    """Thread-safe LRU map of key -> value, each valid for one version and at most 'ttl' seconds."""
+
+    def __init__(self, max_entries=256, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # key -> (version, stored at, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """The value stored for 'key' at 'version', or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self._entries[key] # Built before the last write, or expired
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        """Stores 'value' (not None) as the result for 'key' at 'version', evicting the least recently used beyond max_entries."""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
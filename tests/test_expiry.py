@@ -0,0 +1,49 @@
+# office-space/tests/test_expiry.py
+"""Expired temporary occupants moved to office_assignments_archive must still show up for the dates they covered."""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # app.py uses a relative DATABASE path
+    import app as app_module
+    monkeypatch.setattr(app_module, '_pool', None)
+    monkeypatch.setattr(app_module, '_support_schema_ready', False)
+    app_module.app.test_cli_runner().invoke(args=['init-db'])
+    yield app_module
+    if app_module._pool is not None:
+        app_module._pool.close_all()
+
+
+def add_occupant(app_module, office_id, full_name, start_date, end_date):
+    conn = sqlite3.connect(app_module.DATABASE)
+    conn.execute('''INSERT INTO office_assignments (office_id, full_name, appointment_type, start_date, end_date, is_temporary)
+                    VALUES (?, ?, 'Visitor', ?, ?, 1)''', [office_id, full_name, start_date, end_date])
+    conn.commit()
+    conn.close()
+
+
+def test_archived_occupants_stay_in_past_date_queries(app_module):
+    client = app_module.app.test_client()
+    office_id = client.get('/api/layout').get_json()["floors"][0]["rooms"][0]["office_id"]
+    add_occupant(app_module, office_id, 'Ada Expired', '2020-01-01', '2020-01-10')
+
+    result = app_module.app.test_cli_runner().invoke(args=['expire-occupants'])
+    assert 'Archived 1 expired occupant(s).' in result.output
+
+    offices = client.get('/api/offices').get_json()
+    assert [o["full_name"] for o in offices[office_id]["occupants"]] == []
+
+    as_of = client.get('/api/offices?as_of=2020-01-05').get_json()
+    assert [o["full_name"] for o in as_of[office_id]["occupants"]] == ['Ada Expired']
+    assert client.get('/api/offices?as_of=2020-01-11').get_json()[office_id]["occupants"] == []
+
+    vacancies = client.get('/api/vacancies?from=2020-01-01&to=2020-01-31').get_json()["offices"]
+    assert [o["full_name"] for o in vacancies[office_id]["departing"]] == ['Ada Expired']
+    assert vacancies[office_id]["vacant_from"] == '2020-01-11'